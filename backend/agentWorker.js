@@ -0,0 +1,147 @@
+const { spawn } = require('child_process');
+const readline = require('readline');
+const path = require('path');
+
+// Pool of resident Python agent workers (agents/worker.py).
+// Each worker speaks newline-delimited JSON over stdin/stdout, so one
+// interpreter serves many requests instead of spawning python per call.
+// A worker that dies sooner than this after starting counts as a crash;
+// crashes back off exponentially and a slot gives up after MAX_CRASHES in a row.
+const HEALTHY_UPTIME_MS = 60000;
+const RESPAWN_BASE_MS = 500;
+const RESPAWN_MAX_MS = 30000;
+const MAX_CRASHES = 6;
+
+class AgentWorkerPool {
+    constructor({ size = 2, pythonCommand = 'python', timeoutMs = 120000 } = {}) {
+        this.size = size;
+        this.pythonCommand = pythonCommand;
+        this.timeoutMs = timeoutMs;
+        this.workers = [];
+        this.nextId = 1;
+
+        for (let i = 0; i < size; i++) {
+            this.workers.push(this.spawnWorker(0));
+        }
+    }
+
+    spawnWorker(crashes) {
+        const proc = spawn(this.pythonCommand, ['-m', 'agents.worker'], {
+            cwd: __dirname,
+            env: { ...process.env, PYTHONPATH: path.join(__dirname, 'agents') }
+        });
+        // synced/syncing: per sync function, the state this worker was last
+        // brought up to and the update in progress (see call())
+        const worker = {
+            proc, pending: new Map(), alive: true, startedAt: Date.now(), crashes,
+            synced: new Map(), syncing: new Map()
+        };
+
+        readline.createInterface({ input: proc.stdout }).on('line', (line) => {
+            let response;
+            try {
+                response = JSON.parse(line);
+            } catch (e) {
+                console.error("Agent Worker Parse Error. Raw output:", line);
+                return;
+            }
+            const call = worker.pending.get(response.id);
+            if (!call) return;
+            worker.pending.delete(response.id);
+            clearTimeout(call.timer);
+            if (response.ok) call.resolve(response.result);
+            else call.reject(new Error(response.error));
+        });
+
+        proc.stderr.on('data', (data) => console.error("Agent Worker:", data.toString()));
+
+        // Without these, a failed spawn (bad PYTHON_COMMAND) or a write to a
+        // worker that just died (EPIPE) would be an unhandled 'error' event
+        proc.on('error', (err) => this.retire(worker, err));
+        proc.stdin.on('error', (err) => this.retire(worker, err));
+        proc.on('close', (code) => this.retire(worker, new Error(`Agent worker exited with code ${code}`)));
+
+        return worker;
+    }
+
+    retire(worker, err) {
+        if (!worker.alive) return;
+        worker.alive = false;
+        if (!this.closed) console.error("Agent Worker Error:", err.message);
+
+        // Fail whatever was in flight
+        for (const call of worker.pending.values()) {
+            clearTimeout(call.timer);
+            call.reject(err);
+        }
+        worker.pending.clear();
+
+        const index = this.workers.indexOf(worker);
+        if (index === -1 || this.closed) return;
+        const crashes = Date.now() - worker.startedAt < HEALTHY_UPTIME_MS ? worker.crashes + 1 : 0;
+        if (crashes >= MAX_CRASHES) {
+            console.error(`Agent worker slot ${index} crashed ${crashes} times in a row; not respawning`);
+            return;
+        }
+        const delay = crashes ? Math.min(RESPAWN_MAX_MS, RESPAWN_BASE_MS * 2 ** (crashes - 1)) : 0;
+        setTimeout(() => {
+            if (!this.closed && this.workers[index] === worker) {
+                this.workers[index] = this.spawnWorker(crashes);
+            }
+        }, delay).unref();
+    }
+
+    // With `sync`, the chosen worker is first brought up to date with state it
+    // keeps between calls (e.g. Pixie's catalog). sync(state) gets what this
+    // worker was last sent (undefined for a fresh worker) and resolves to null
+    // when nothing changed, or to { state, method, params } to send first.
+    async call(method, params, sync = null) {
+        // Least-loaded live worker gets the request
+        const live = this.workers.filter((w) => w.alive);
+        if (live.length === 0) {
+            throw new Error("No agent worker available");
+        }
+        const worker = live.reduce((a, b) => (b.pending.size < a.pending.size ? b : a));
+        if (sync) await this.syncWorker(worker, sync);
+        return this.send(worker, method, params);
+    }
+
+    syncWorker(worker, sync) {
+        // One update per worker at a time; calls arriving meanwhile wait for it
+        const running = worker.syncing.get(sync);
+        if (running) return running;
+        const update = (async () => {
+            const next = await sync(worker.synced.get(sync));
+            if (!next) return;
+            await this.send(worker, next.method, next.params);
+            worker.synced.set(sync, next.state);
+        })().finally(() => worker.syncing.delete(sync));
+        worker.syncing.set(sync, update);
+        return update;
+    }
+
+    send(worker, method, params) {
+        const id = String(this.nextId++);
+
+        return new Promise((resolve, reject) => {
+            const timer = setTimeout(() => {
+                worker.pending.delete(id);
+                reject(new Error(`Agent worker timed out on ${method}`));
+            }, this.timeoutMs);
+            worker.pending.set(id, { resolve, reject, timer });
+            worker.proc.stdin.write(JSON.stringify({ id, method, params }) + '\n', (err) => {
+                if (!err || !worker.pending.has(id)) return;
+                worker.pending.delete(id);
+                clearTimeout(timer);
+                reject(err);
+            });
+        });
+    }
+
+    close() {
+        this.closed = true;
+        for (const worker of this.workers) worker.proc.stdin.end();
+    }
+}
+
+module.exports = { AgentWorkerPool };
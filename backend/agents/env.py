@@ -0,0 +1,72 @@
+"""
+Loads the nearest .env into os.environ, once per process.
+
+Looks in agents/ and then each parent directory (like load_dotenv() does
+when called from here). Every agent module reads its settings at import, so
+this runs at import too; the file is parsed here rather than with
+python-dotenv, which would cost more than the rest of a light entry point's
+imports. Supported: KEY=value lines, optional `export`, single or double
+quotes, and `#` comments (no ${VAR} expansion or multi-line values).
+"""
+import os
+import re
+
+AGENTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_loaded = False
+
+LINE_PATTERN = re.compile(r"^\s*(?:export\s+)?([A-Za-z_][A-Za-z0-9_.]*)\s*=\s*(.*?)\s*$")
+
+
+def find_env_file(start=AGENTS_DIR):
+    directory = start
+    while True:
+        path = os.path.join(directory, ".env")
+        if os.path.isfile(path):
+            return path
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def parse(text):
+    """
+    Returns {name: value} for the assignments in a .env file's text.
+    """
+    values = {}
+    for line in text.splitlines():
+        match = LINE_PATTERN.match(line)
+        if not match:
+            continue
+        name, value = match.groups()
+        if value[:1] in ("'", '"'):
+            quote = value[0]
+            end = value.find(quote, 1)
+            value = value[1:end] if end != -1 else value[1:]
+            if quote == '"':
+                value = value.replace("\\n", "\n")
+        else:
+            value = re.split(r"\s+#", value, 1)[0].strip()
+        values[name] = value
+    return values
+
+
+def load():
+    """
+    Idempotent; variables already set in the environment win, as with load_dotenv().
+    """
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    path = find_env_file()
+    if not path:
+        return
+    try:
+        with open(path, encoding="utf-8") as f:
+            values = parse(f.read())
+    except OSError:
+        return
+    for name, value in values.items():
+        os.environ.setdefault(name, value)
@@ -0,0 +1,279 @@
+"""
+Local image preprocessing for Pixel.
+
+Loads an upload once, then:
+  - shrinks it to a bounded JPEG thumbnail for the vision model,
+  - computes the dominant color by palette quantization (no LLM needed),
+  - computes a perceptual hash (dHash) so near-duplicate shots can reuse an
+    earlier vision result instead of making a new call.
+
+URLs come from users, so downloads only go to public http(s) hosts (checked
+again on every redirect), stop at MAX_DOWNLOAD_BYTES, and images over
+MAX_PIXELS are rejected before they are decoded.
+"""
+import os
+import io
+import time
+import base64
+import sqlite3
+import itertools
+import threading
+from storage import cache_path
+
+THUMBNAIL_SIZE = int(os.getenv("PIXEL_THUMBNAIL_SIZE", "512"))
+THUMBNAIL_QUALITY = int(os.getenv("PIXEL_THUMBNAIL_QUALITY", "85"))
+FETCH_TIMEOUT = float(os.getenv("PIXEL_FETCH_TIMEOUT", "15"))
+
+# Keep-alive connections per image host (backfills download concurrently)
+HTTP_POOL_SIZE = int(os.getenv("PIXEL_HTTP_POOL_SIZE", "32"))
+
+# Limits for user-supplied images
+MAX_DOWNLOAD_BYTES = int(float(os.getenv("PIXEL_MAX_DOWNLOAD_MB", "20")) * 1024 * 1024)
+MAX_PIXELS = int(os.getenv("PIXEL_MAX_PIXELS", str(40_000_000)))
+MAX_REDIRECTS = 3
+# Only for local development against images on localhost / a LAN
+ALLOW_PRIVATE_URLS = os.getenv("PIXEL_ALLOW_PRIVATE_URLS", "").lower() in ("1", "true", "yes")
+
+# Max differing bits (out of 64) for two images to count as the same shot
+DUPLICATE_DISTANCE = int(os.getenv("PIXEL_DUPLICATE_DISTANCE", "6"))
+INDEX_PATH = os.getenv("PIXEL_INDEX_PATH") or cache_path("pixel_index.sqlite3")
+
+# Reused HTTP connections for image downloads (requests and Pillow are
+# imported on first use to keep Pixel's cold start short)
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
+
+
+class ImageRejected(ValueError):
+    """
+    The image URL or the image itself is not acceptable (unsafe host, too big).
+    """
+
+
+def check_url(url):
+    """
+    Raises ImageRejected unless `url` is http(s) and its host resolves only
+    to public addresses (no loopback, private, link-local or metadata IPs).
+    """
+    import socket
+    import ipaddress
+    from urllib.parse import urlsplit
+
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ImageRejected("Only http(s) image URLs are allowed")
+    if ALLOW_PRIVATE_URLS:
+        return
+    try:
+        infos = socket.getaddrinfo(parts.hostname, parts.port or (443 if parts.scheme == "https" else 80),
+                                   proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError) as e:
+        raise ImageRejected(f"Cannot resolve image host {parts.hostname}: {str(e)}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise ImageRejected(f"Image host {parts.hostname} is not a public address")
+
+
+def download(url, http=None):
+    """
+    GETs an image URL, at most MAX_DOWNLOAD_BYTES, following (and re-checking)
+    up to MAX_REDIRECTS redirects.
+    """
+    from urllib.parse import urljoin
+    session = http or get_session()
+    for _ in range(MAX_REDIRECTS + 1):
+        check_url(url)
+        with session.get(url, timeout=FETCH_TIMEOUT, stream=True, allow_redirects=False) as response:
+            if response.is_redirect:
+                url = urljoin(url, response.headers["location"])
+                continue
+            response.raise_for_status()
+            length = response.headers.get("content-length")
+            if length and length.isdigit() and int(length) > MAX_DOWNLOAD_BYTES:
+                raise ImageRejected(f"Image is larger than {MAX_DOWNLOAD_BYTES} bytes")
+            chunks, total = [], 0
+            for chunk in response.iter_content(64 * 1024):
+                total += len(chunk)
+                if total > MAX_DOWNLOAD_BYTES:
+                    raise ImageRejected(f"Image is larger than {MAX_DOWNLOAD_BYTES} bytes")
+                chunks.append(chunk)
+            return b"".join(chunks)
+    raise ImageRejected("Too many redirects")
+
+
+def load_image(image_url, http=None):
+    """
+    Fetches an http(s) or data: URL and returns it as an RGB PIL image.
+    Raises ImageRejected for unsafe URLs and oversized files or images.
+    """
+    from PIL import Image
+    if image_url.startswith("data:"):
+        encoded = image_url.split(",", 1)[1]
+        if len(encoded) * 3 // 4 > MAX_DOWNLOAD_BYTES:
+            raise ImageRejected(f"Image is larger than {MAX_DOWNLOAD_BYTES} bytes")
+        data = base64.b64decode(encoded)
+    else:
+        data = download(image_url, http)
+    # Only the header has been read so far: check the size before decoding
+    image = Image.open(io.BytesIO(data))
+    if image.width * image.height > MAX_PIXELS:
+        raise ImageRejected(f"Image is {image.width}x{image.height}, over {MAX_PIXELS} pixels")
+    image.load()
+    return image.convert("RGB")
+
+
+def thumbnail_data_url(image, max_size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY):
+    """
+    Downsized JPEG copy of the image as a base64 data URL.
+    """
+    thumb = image.copy()
+    thumb.thumbnail((max_size, max_size))
+    buffer = io.BytesIO()
+    thumb.save(buffer, format="JPEG", quality=quality, optimize=True)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def dominant_color(image, colors=5):
+    """
+    Most common color after median-cut quantization, as "#RRGGBB".
+    """
+    small = image.copy()
+    small.thumbnail((128, 128))
+    quantized = small.quantize(colors=colors)
+    palette = quantized.getpalette()
+    _, index = max(quantized.getcolors())
+    r, g, b = palette[index * 3:index * 3 + 3]
+    return f"#{r:02X}{g:02X}{b:02X}"
+
+
+def perceptual_hash(image, hash_size=8):
+    """
+    64-bit difference hash: robust to resizing, recompression and color shifts.
+    """
+    from PIL import Image
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+# --- Near-duplicate index (phash -> earlier vision result) ---
+#
+# Each 64-bit hash is also stored as four 16-bit bands. Two hashes within
+# max_distance bits differ in at most max_distance // 4 bits in at least one
+# band (pigeonhole), so a lookup only has to fetch the rows whose band is
+# within that many bits of ours, instead of scanning the whole table.
+
+BANDS = 4
+BAND_BITS = 16
+
+_local = threading.local()
+
+
+def _band_keys(phash):
+    # (band number, band value) packed into one integer column
+    mask = (1 << BAND_BITS) - 1
+    return [(band << BAND_BITS) | ((phash >> (band * BAND_BITS)) & mask) for band in range(BANDS)]
+
+
+def _neighbor_keys(phash, radius):
+    keys = []
+    for key in _band_keys(phash):
+        for flips in range(radius + 1):
+            for bits in itertools.combinations(range(BAND_BITS), flips):
+                flipped = key
+                for bit in bits:
+                    flipped ^= 1 << bit
+                keys.append(flipped)
+    return keys
+
+
+def _connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(INDEX_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS images (phash TEXT PRIMARY KEY, result TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS image_bands (band_key INTEGER NOT NULL, phash TEXT NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS image_bands_key ON image_bands (band_key)")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+            # Index files from before the bands existed
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+                    conn.execute("DELETE FROM image_bands")
+                    for (stored_hash,) in conn.execute("SELECT phash FROM images").fetchall():
+                        conn.executemany("INSERT INTO image_bands (band_key, phash) VALUES (?, ?)",
+                                         [(key, stored_hash) for key in _band_keys(int(stored_hash, 16))])
+                    conn.execute("PRAGMA user_version = 1")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        _local.conn = conn
+    return conn
+
+
+def find_similar(phash, max_distance=DUPLICATE_DISTANCE):
+    """
+    Returns the stored result JSON of the closest indexed image within
+    max_distance bits, or None.
+    """
+    keys = _neighbor_keys(phash, max_distance // BANDS)
+    rows = _connection().execute(
+        "SELECT phash, result FROM images WHERE phash IN "
+        f"(SELECT phash FROM image_bands WHERE band_key IN ({','.join('?' * len(keys))}))",
+        keys,
+    )
+    best = None
+    for stored_hash, result in rows:
+        distance = hamming(phash, int(stored_hash, 16))
+        if distance <= max_distance and (best is None or distance < best[0]):
+            best = (distance, result)
+    return best[1] if best else None
+
+
+def remember(phash, result_json):
+    stored_hash = f"{phash:016x}"
+    conn = _connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO images (phash, result, created) VALUES (?, ?, ?)",
+            (stored_hash, result_json, time.time()),
+        )
+        conn.execute("DELETE FROM image_bands WHERE phash = ?", (stored_hash,))
+        conn.executemany("INSERT INTO image_bands (band_key, phash) VALUES (?, ?)",
+                         [(key, stored_hash) for key in _band_keys(phash)])
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
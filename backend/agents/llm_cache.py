@@ -0,0 +1,152 @@
+"""
+On-disk LLM response cache.
+
+Responses are stored in SQLite (WAL mode, so several agent processes can read
+and write at once) under a content hash of model + prompts + generation
+params. Entries expire after a per-caller TTL, and the least recently used
+ones are evicted once the cache grows past LLM_CACHE_MAX_BYTES.
+
+Set LLM_CACHE_DISABLED=1 to bypass it everywhere, or pass use_cache=False
+to a single call that needs fresh output.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from storage import cache_path
+
+CACHE_PATH = os.getenv("LLM_CACHE_PATH") or cache_path("llm_cache.sqlite3")
+DEFAULT_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+ENABLED = os.getenv("LLM_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    expires REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# sqlite3 connections can't be shared across threads
+_local = threading.local()
+
+def _connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(CACHE_PATH, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+def _bump(conn, name):
+    conn.execute(
+        "INSERT INTO counters (name, value) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET value = value + 1",
+        (name,),
+    )
+
+def make_key(model, system_prompt, user_input, **params):
+    """
+    Content hash of everything that affects the model's output.
+    """
+    payload = json.dumps([model, system_prompt, user_input, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def get(key):
+    """
+    Returns the cached value for `key`, or None on a miss / expired entry.
+    """
+    if not ENABLED:
+        return None
+    try:
+        conn = _connection()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value FROM entries WHERE key = ? AND expires > ?", (key, now)
+        ).fetchone()
+        if row is None:
+            _bump(conn, "misses")
+            return None
+        conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        _bump(conn, "hits")
+        return row[0]
+    except sqlite3.Error as e:
+        print(f"⚠️ LLM cache read failed: {str(e)}", file=sys.stderr)
+        return None
+
+def put(key, value, ttl=None):
+    if not ENABLED or value is None:
+        return
+    ttl = DEFAULT_TTL if ttl is None else ttl
+    try:
+        conn = _connection()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, created, expires, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (key, value, len(value.encode("utf-8")), now, now + ttl, now),
+        )
+        _evict(conn, now)
+    except sqlite3.Error as e:
+        print(f"⚠️ LLM cache write failed: {str(e)}", file=sys.stderr)
+
+def _evict(conn, now):
+    """
+    Drops expired entries, then least recently used ones until under MAX_BYTES.
+    """
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= MAX_BYTES:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+            if total <= MAX_BYTES:
+                break
+            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        if evicted:
+            conn.execute(
+                "INSERT INTO counters (name, value) VALUES ('evictions', ?) "
+                "ON CONFLICT(name) DO UPDATE SET value = value + ?",
+                (evicted, evicted),
+            )
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        conn.execute("ROLLBACK")
+        raise
+
+def stats():
+    """
+    Hit/miss/eviction counters plus current size of the cache.
+    """
+    conn = _connection()
+    result = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+    entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+    result.update({"entries": entries, "bytes": size})
+    return result
+
+def clear():
+    conn = _connection()
+    conn.execute("DELETE FROM entries")
+    conn.execute("DELETE FROM counters")
+
+if __name__ == "__main__":
+    print(json.dumps(stats()))
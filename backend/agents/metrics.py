@@ -0,0 +1,285 @@
+"""
+Per-call metrics for the agent layer.
+
+Every LLM attempt (OpenRouter or Gemini) is recorded with the calling agent,
+the model, its position in the fallback chain, latency, token usage and the
+outcome (ok / error / rate_limited / timeout):
+  - as one JSON line per call when AGENT_METRICS_LOG is set (a path, or "stderr"),
+  - as counters merged into a shared state file across processes and rendered
+    to a Prometheus textfile (AGENT_METRICS_PROM, for node_exporter's textfile
+    collector; server.js also serves it on GET /metrics).
+
+Short-lived scripts flush at exit; a resident worker also flushes every
+FLUSH_INTERVAL seconds. run_main() wraps an entry point's main() with timing
+and, when AGENT_PROFILE_DIR is set, writes a cProfile dump per run.
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import tempfile
+import threading
+from storage import cache_path, file_lock, read_json, write_json_atomic
+
+ENABLED = os.getenv("AGENT_METRICS_DISABLED", "").lower() not in ("1", "true", "yes")
+LOG_PATH = os.getenv("AGENT_METRICS_LOG")
+STATE_PATH = os.getenv("AGENT_METRICS_STATE") or cache_path("agent_metrics.json")
+PROM_PATH = os.getenv("AGENT_METRICS_PROM") or cache_path("agent_metrics.prom")
+PROFILE_DIR = os.getenv("AGENT_PROFILE_DIR")
+FLUSH_INTERVAL = float(os.getenv("AGENT_METRICS_FLUSH_SECONDS", "15"))
+
+# Latency histogram buckets (seconds)
+BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def _empty():
+    return {"calls": {}, "tokens": {}, "latency": {}, "entries": {}, "hedges": {}}
+
+
+_pending = _empty()
+
+
+def outcome_of(error):
+    """
+    Classifies an exception from either SDK as rate_limited, timeout or error.
+    """
+    name = type(error).__name__
+    if getattr(error, "status_code", None) == 429 or "429" in str(error) or name == "ResourceExhausted":
+        return "rate_limited"
+    if isinstance(error, TimeoutError) or "Timeout" in name or name == "DeadlineExceeded":
+        return "timeout"
+    return "error"
+
+
+def usage_tokens(usage):
+    """
+    (prompt, completion) token counts from an OpenAI `usage` or a Gemini
+    `usage_metadata`; None where the provider didn't say.
+    """
+    if usage is None:
+        return None, None
+    prompt = getattr(usage, "prompt_tokens", None)
+    if prompt is None:
+        prompt = getattr(usage, "prompt_token_count", None)
+    completion = getattr(usage, "completion_tokens", None)
+    if completion is None:
+        completion = getattr(usage, "candidates_token_count", None)
+    return prompt, completion
+
+
+def _key(*labels):
+    return "\t".join(str(label) for label in labels)
+
+
+def _add_histogram(table, key, value):
+    entry = table.setdefault(key, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+    for i, bound in enumerate(BUCKETS):
+        if value <= bound:
+            entry["buckets"][i] += 1
+    entry["sum"] += value
+    entry["count"] += 1
+
+
+def _log(event):
+    line = json.dumps(event)
+    if LOG_PATH == "stderr":
+        print(line, file=sys.stderr)
+        return
+    with open(LOG_PATH, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+
+def record(agent, model, attempt, latency, outcome, prompt_tokens=None, completion_tokens=None,
+           provider="openrouter"):
+    """
+    Records one LLM attempt. `attempt` is the model's index in the fallback chain.
+    """
+    if not ENABLED:
+        return
+    agent = agent or "unknown"
+    with _lock:
+        calls, tokens = _pending["calls"], _pending["tokens"]
+        key = _key(agent, model, attempt, outcome)
+        calls[key] = calls.get(key, 0) + 1
+        _add_histogram(_pending["latency"], _key(agent, model), latency)
+        for kind, count in (("prompt", prompt_tokens), ("completion", completion_tokens)):
+            if count:
+                key = _key(agent, model, kind)
+                tokens[key] = tokens.get(key, 0) + count
+        if LOG_PATH:
+            _log({"ts": round(time.time(), 3), "agent": agent, "provider": provider, "model": model,
+                  "attempt": attempt, "latency_ms": round(latency * 1000, 1), "outcome": outcome,
+                  "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens})
+    if time.monotonic() - _last_flush >= FLUSH_INTERVAL:
+        flush()
+
+
+def record_hedge(agent, event):
+    """
+    Counts a hedged-request event: fired, won or over_budget.
+    """
+    if not ENABLED:
+        return
+    with _lock:
+        hedges = _pending["hedges"]
+        key = _key(agent or "unknown", event)
+        hedges[key] = hedges.get(key, 0) + 1
+
+
+def record_entry(name, elapsed, outcome):
+    """
+    Records one run of a script entry point (see run_main).
+    """
+    if not ENABLED:
+        return
+    with _lock:
+        entry = _pending["entries"].setdefault(_key(name, outcome), {"sum": 0.0, "count": 0})
+        entry["sum"] += elapsed
+        entry["count"] += 1
+        if LOG_PATH:
+            _log({"ts": round(time.time(), 3), "entry": name, "elapsed_ms": round(elapsed * 1000, 1),
+                  "outcome": outcome})
+
+
+def _merge(state, pending):
+    for table in ("calls", "tokens", "hedges"):
+        target = state.setdefault(table, {})
+        for key, value in pending[table].items():
+            target[key] = target.get(key, 0) + value
+    for key, value in pending["latency"].items():
+        entry = state.setdefault("latency", {}).setdefault(key, {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0})
+        entry["buckets"] = [a + b for a, b in zip(entry["buckets"], value["buckets"])]
+        entry["sum"] += value["sum"]
+        entry["count"] += value["count"]
+    for key, value in pending["entries"].items():
+        entry = state.setdefault("entries", {}).setdefault(key, {"sum": 0.0, "count": 0})
+        entry["sum"] += value["sum"]
+        entry["count"] += value["count"]
+
+
+def flush():
+    """
+    Merges this process's counters into the shared state and rewrites the
+    Prometheus textfile. Never raises: metrics must not break an agent.
+    """
+    global _pending, _last_flush
+    with _lock:
+        pending, _pending = _pending, _empty()
+        _last_flush = time.monotonic()
+    if not any(pending.values()):
+        return
+    try:
+        with file_lock(STATE_PATH):
+            state = read_json(STATE_PATH, default={}) or {}
+            _merge(state, pending)
+            write_json_atomic(STATE_PATH, state)
+            _write_text_atomic(PROM_PATH, render_prometheus(state))
+    except OSError as e:
+        print(f"⚠️ Could not write agent metrics: {str(e)}", file=sys.stderr)
+
+
+def _write_text_atomic(path, text):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-", suffix=".prom")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _labels(**labels):
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def render_prometheus(state):
+    """
+    Renders merged counters in the Prometheus text exposition format.
+    """
+    lines = [
+        "# HELP fashfolio_llm_calls_total LLM attempts by agent, model, fallback position and outcome.",
+        "# TYPE fashfolio_llm_calls_total counter",
+    ]
+    for key, count in sorted(state.get("calls", {}).items()):
+        agent, model, attempt, outcome = key.split("\t")
+        lines.append(f"fashfolio_llm_calls_total{_labels(agent=agent, model=model, attempt=attempt, outcome=outcome)} {count}")
+
+    lines += [
+        "# HELP fashfolio_llm_tokens_total Tokens reported in usage, by agent, model and kind.",
+        "# TYPE fashfolio_llm_tokens_total counter",
+    ]
+    for key, count in sorted(state.get("tokens", {}).items()):
+        agent, model, kind = key.split("\t")
+        lines.append(f"fashfolio_llm_tokens_total{_labels(agent=agent, model=model, kind=kind)} {count}")
+
+    lines += [
+        "# HELP fashfolio_llm_call_duration_seconds Latency of one LLM attempt.",
+        "# TYPE fashfolio_llm_call_duration_seconds histogram",
+    ]
+    for key, entry in sorted(state.get("latency", {}).items()):
+        agent, model = key.split("\t")
+        # Buckets are stored per-bound already cumulative (value <= bound)
+        for bound, count in zip(BUCKETS, entry["buckets"]):
+            lines.append(f"fashfolio_llm_call_duration_seconds_bucket{_labels(agent=agent, model=model, le=bound)} {count}")
+        lines.append(f"fashfolio_llm_call_duration_seconds_bucket{_labels(agent=agent, model=model, le='+Inf')} {entry['count']}")
+        lines.append(f"fashfolio_llm_call_duration_seconds_sum{_labels(agent=agent, model=model)} {round(entry['sum'], 6)}")
+        lines.append(f"fashfolio_llm_call_duration_seconds_count{_labels(agent=agent, model=model)} {entry['count']}")
+
+    lines += [
+        "# HELP fashfolio_llm_hedges_total Hedged requests by agent and event (fired, won, over_budget).",
+        "# TYPE fashfolio_llm_hedges_total counter",
+    ]
+    for key, count in sorted(state.get("hedges", {}).items()):
+        agent, event = key.split("\t")
+        lines.append(f"fashfolio_llm_hedges_total{_labels(agent=agent, event=event)} {count}")
+
+    lines += [
+        "# HELP fashfolio_agent_entry_duration_seconds Wall time of agent script entry points.",
+        "# TYPE fashfolio_agent_entry_duration_seconds summary",
+    ]
+    for key, entry in sorted(state.get("entries", {}).items()):
+        name, outcome = key.split("\t")
+        lines.append(f"fashfolio_agent_entry_duration_seconds_sum{_labels(entry=name, outcome=outcome)} {round(entry['sum'], 6)}")
+        lines.append(f"fashfolio_agent_entry_duration_seconds_count{_labels(entry=name, outcome=outcome)} {entry['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def run_main(name, main):
+    """
+    Runs an entry point's main() under timing, and under cProfile when
+    AGENT_PROFILE_DIR is set (one .prof file per run, view with snakeviz or pstats).
+    """
+    profiler = None
+    if PROFILE_DIR:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        return main()
+    except SystemExit as e:
+        outcome = "ok" if not e.code else "error"
+        raise
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        record_entry(name, time.perf_counter() - started, outcome)
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            path = os.path.join(PROFILE_DIR, f"{name}-{os.getpid()}-{int(time.time())}.prof")
+            profiler.dump_stats(path)
+            print(f"📈 Profile written to {path}", file=sys.stderr)
+
+
+atexit.register(flush)
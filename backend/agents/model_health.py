@@ -0,0 +1,93 @@
+"""
+Model health tracking + circuit breaker for the FALLBACK_MODELS chain.
+
+Every call records success/failure and latency per model in a small JSON
+file, so separate agent processes share what they learned. A model that
+fails FAILURE_THRESHOLD times in a row (of any kind) has its circuit opened
+for COOLDOWN_SECONDS, and a 429 opens it for at least its Retry-After
+(RATE_LIMIT_COOLDOWN_SECONDS without one). The model is skipped until then;
+the remaining fallbacks are tried fastest-first by recent p50 latency.
+"""
+import os
+import time
+from storage import cache_path, file_lock, read_json, write_json_atomic
+
+HEALTH_PATH = os.getenv("MODEL_HEALTH_PATH") or cache_path("model_health.json")
+
+FAILURE_THRESHOLD = int(os.getenv("MODEL_FAILURE_THRESHOLD", "3"))
+COOLDOWN_SECONDS = float(os.getenv("MODEL_COOLDOWN_SECONDS", "60"))
+RATE_LIMIT_COOLDOWN_SECONDS = float(os.getenv("MODEL_RATE_LIMIT_COOLDOWN_SECONDS", "120"))
+
+# How many recent latencies to keep per model
+LATENCY_WINDOW = 20
+
+def load_state():
+    return read_json(HEALTH_PATH, default={}) or {}
+
+def _update(model, change):
+    with file_lock(HEALTH_PATH):
+        state = load_state()
+        entry = state.setdefault(model, {"latencies": [], "failures": 0, "open_until": 0})
+        change(entry)
+        write_json_atomic(HEALTH_PATH, state)
+
+def record_success(model, latency):
+    def change(entry):
+        entry["latencies"] = (entry["latencies"] + [round(latency, 3)])[-LATENCY_WINDOW:]
+        entry["failures"] = 0
+        entry["open_until"] = 0
+    _update(model, change)
+
+def record_failure(model, rate_limited=False, retry_after=None):
+    """
+    Counts a failure; opens the circuit after repeated failures or any 429.
+    A short Retry-After never cuts the repeated-failure cooldown short.
+    """
+    def change(entry):
+        entry["failures"] += 1
+        cooldown = 0
+        if rate_limited:
+            # The server's Retry-After beats our default guess
+            cooldown = retry_after if retry_after is not None else RATE_LIMIT_COOLDOWN_SECONDS
+        if entry["failures"] >= FAILURE_THRESHOLD:
+            cooldown = max(cooldown, COOLDOWN_SECONDS)
+        if cooldown:
+            entry["open_until"] = max(entry.get("open_until", 0), time.time() + cooldown)
+    _update(model, change)
+
+def is_rate_limit_error(error):
+    return getattr(error, "status_code", None) == 429 or "429" in str(error)
+
+def is_available(model, state=None):
+    state = load_state() if state is None else state
+    return state.get(model, {}).get("open_until", 0) <= time.time()
+
+def percentile(model, q, state=None):
+    """
+    Returns the q-th percentile (0-100) of recent latency, or None if unknown.
+    """
+    state = load_state() if state is None else state
+    latencies = sorted(state.get(model, {}).get("latencies", []))
+    if not latencies:
+        return None
+    index = min(len(latencies) - 1, int(round(q / 100 * (len(latencies) - 1))))
+    return latencies[index]
+
+def order_models(models):
+    """
+    Orders a fallback chain: the requested model first (if its circuit is
+    closed), then healthy fallbacks by p50 latency, then open circuits as
+    a last resort.
+    """
+    state = load_state()
+    primary, rest = models[0], models[1:]
+
+    healthy = [m for m in rest if is_available(m, state)]
+    tripped = [m for m in rest if not is_available(m, state)]
+
+    # Unknown latency sorts after measured models but keeps its original order
+    healthy.sort(key=lambda m: (percentile(m, 50, state) is None, percentile(m, 50, state) or 0))
+
+    if is_available(primary, state):
+        return [primary] + healthy + tripped
+    return healthy + [primary] + tripped
@@ -1,12 +1,48 @@
+import os
 import sys
 import json
-from utils_openrouter import query_openrouter_vision
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import image_prep
+import metrics
+from utils_openrouter import query_openrouter, query_openrouter_vision, INTERACTIVE, BATCH
+from structured_output import parse_structured, supports_json_mode, StructuredOutputError, JSON_MODE
 
 # PIXEL: Uses Llama 3.2 11B Vision (Free)
 MODEL = "meta-llama/llama-3.2-11b-vision-instruct:free"
 
-def analyze_image(image_url):
-    prompt = """
+# Cheap text model that re-formats an unusable answer (it never sees the image)
+REPAIR_MODEL = "meta-llama/llama-3.2-3b-instruct:free"
+
+# The same image URL keeps its analysis for a month
+CACHE_TTL = 30 * 86400
+
+# Backfill mode: images analyzed at once, and extra passes over failures
+BACKFILL_CONCURRENCY = int(os.getenv("PIXEL_BACKFILL_CONCURRENCY", "8"))
+BACKFILL_RETRIES = int(os.getenv("PIXEL_BACKFILL_RETRIES", "2"))
+
+SCHEMA = {
+    "fabric": {"type": str, "default": "Unknown"},
+    "style_tags": {"type": list, "required": True},
+    "visual_rating": {"type": float, "required": True, "min": 0, "max": 10},
+}
+
+# When the model also has to pick the color
+FULL_SCHEMA = {**SCHEMA, "color_hex": {"type": str, "default": None}}
+
+# Color is computed locally, so the model only judges fabric/style/rating
+PROMPT = """
+    Analyze this fashion image. Return ONLY a JSON object:
+    {
+        "fabric": "Material Name",
+        "style_tags": ["Tag1", "Tag2"],
+        "visual_rating": 8.5
+    }
+    """
+
+# Used when the image can't be loaded locally and the model has to see the URL
+FULL_PROMPT = """
     Analyze this fashion image. Return ONLY a JSON object:
     {
         "color_hex": "#RRGGBB",
@@ -15,23 +51,169 @@ def analyze_image(image_url):
         "visual_rating": 8.5
     }
     """
+
+def analyze_image(image_url, http=None, priority=INTERACTIVE, use_cache=True):
+    # 1. Preprocess locally: thumbnail, dominant color, perceptual hash
+    try:
+        image = image_prep.load_image(image_url, http)
+    except image_prep.ImageRejected as e:
+        # Not something to hand the vision model either
+        return {"error": f"Image rejected: {str(e)}"}
+    except Exception as e:
+        print(f"⚠️ Pixel could not load image locally ({str(e)}), sending URL", file=sys.stderr)
+        return _analyze_with_model(FULL_PROMPT, image_url, FULL_SCHEMA, priority, use_cache)
+
+    color_hex = image_prep.dominant_color(image)
+    phash = image_prep.perceptual_hash(image)
+
+    # 2. Near-duplicate of an image we already analyzed? Reuse it.
+    previous = image_prep.find_similar(phash)
+    if previous is not None:
+        print("♻️ Pixel reused analysis of a near-duplicate image", file=sys.stderr)
+        return {**json.loads(previous), "color_hex": color_hex}
+
+    # 3. Vision model sees the thumbnail, not the full upload
+    result = _analyze_with_model(PROMPT, image_prep.thumbnail_data_url(image), SCHEMA, priority, use_cache)
+    if "error" in result:
+        return result
+
+    result["color_hex"] = color_hex
+    image_prep.remember(phash, json.dumps(result))
+    return result
+
+def _repair(prompt, priority=INTERACTIVE):
+    return query_openrouter(REPAIR_MODEL, "You fix malformed JSON. Reply with JSON only.", prompt, use_cache=False,
+                            priority=priority, agent="pixel")
+
+def _analyze_with_model(prompt, image_url, schema, priority=INTERACTIVE, use_cache=True):
+    # 1. Get raw text from Vision Model (JSON mode where the model has it)
+    response_format = JSON_MODE if supports_json_mode(MODEL) else None
+    raw_response = query_openrouter_vision(MODEL, prompt, image_url, use_cache=use_cache, cache_ttl=CACHE_TTL,
+                                           response_format=response_format, priority=priority, agent="pixel")
     
-    # 1. Get raw text from Vision Model
-    raw_response = query_openrouter_vision(MODEL, prompt, image_url)
-    
-    # 2. Clean up JSON (Models often add ```json blocks)
+    # 2. Pull out and validate the JSON (models add prose, fences, trailing commas...)
+    #    A failed call has nothing worth repairing.
+    if raw_response and not raw_response.startswith("Error:"):
+        try:
+            # Repairs run at the caller's priority, so a backfill never jumps live uploads
+            return parse_structured(raw_response, schema, repair=lambda text: _repair(text, priority))
+        except StructuredOutputError:
+            pass
+    return {
+        "error": "Failed to parse JSON", 
+        "raw_output": raw_response, 
+        "style_tags": ["AI_ERROR"], 
+        "visual_rating": 0
+    }
+
+def product_fields(item_id, result):
+    """
+    Pixel's result under the Product model's field names.
+    """
+    return {
+        "id": item_id,
+        "aiTags": result.get("style_tags"),
+        "visualScore": result.get("visual_rating"),
+        "dominantColor": result.get("color_hex"),
+        "fabricType": result.get("fabric"),
+    }
+
+def _backfill_one(item, use_cache):
     try:
-        clean_json = raw_response.replace("```json", "").replace("```", "").strip()
-        return json.loads(clean_json)
-    except:
-        return {
-            "error": "Failed to parse JSON", 
-            "raw_output": raw_response, 
-            "style_tags": ["AI_ERROR"], 
-            "visual_rating": 0
-        }
+        return item, analyze_image(item["imageUrl"], priority=BATCH, use_cache=use_cache)
+    except Exception as e:
+        return item, {"error": str(e)}
+
+def _backfill_pass(items, concurrency, emit, use_cache=True):
+    """
+    Analyzes `items` (consumed lazily, so the input never has to fit in
+    memory) with at most `concurrency` in flight. Successes are emitted as
+    they complete; failures are returned as (item, result) pairs.
+    """
+    failed = []
+    items = iter(items)
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            # Keep a small backlog queued so no thread waits on input parsing
+            for item in items:
+                in_flight.add(executor.submit(_backfill_one, item, use_cache))
+                if len(in_flight) >= concurrency * 2:
+                    break
+            if not in_flight:
+                return failed
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item, result = future.result()
+                if "error" in result:
+                    failed.append((item, result))
+                else:
+                    emit(product_fields(item.get("id"), result))
+
+def backfill(lines, out, concurrency=BACKFILL_CONCURRENCY, retries=BACKFILL_RETRIES):
+    """
+    Bulk mode: reads NDJSON {id, imageUrl} lines and writes one NDJSON result
+    per image (aiTags, visualScore, dominantColor, fabricType) as soon as it
+    is done. Vision calls run at batch priority, so live uploads go first.
+    Failures get up to `retries` more passes at the end, then an
+    {"id", "error"} line. Returns summary counts.
+    """
+    stats = {"ok": 0, "failed": 0, "retried": 0}
+    started = time.monotonic()
+
+    def emit(record):
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+        stats["failed" if "error" in record else "ok"] += 1
+        done = stats["ok"] + stats["failed"]
+        if done % 100 == 0:
+            rate = done / max(time.monotonic() - started, 1e-9)
+            print(f"🖼️ Pixel backfill: {done} done ({stats['failed']} failed), {rate:.1f}/s", file=sys.stderr)
+
+    def read_items():
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                emit({"id": None, "error": "Invalid JSON line"})
+                continue
+            if not isinstance(item, dict):
+                emit({"id": None, "error": "Line must be a JSON object"})
+                continue
+            if not item.get("imageUrl"):
+                emit({"id": item.get("id"), "error": "No URL provided"})
+                continue
+            yield item
+
+    failed = _backfill_pass(read_items(), concurrency, emit)
+    for round_number in range(retries):
+        if not failed:
+            break
+        print(f"🔁 Retrying {len(failed)} failed images (pass {round_number + 2})", file=sys.stderr)
+        stats["retried"] += len(failed)
+        # Skip the cache: a cached answer is what failed last time
+        failed = _backfill_pass([item for item, _ in failed], concurrency, emit, use_cache=False)
+
+    for item, result in failed:
+        emit({"id": item.get("id"), "error": result.get("error"), "raw_output": result.get("raw_output")})
+    stats["seconds"] = round(time.monotonic() - started, 1)
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Pixel visual analysis (JSON {imageUrl} on stdin)")
+    parser.add_argument('--backfill', action='store_true',
+                        help="Bulk mode: NDJSON {id, imageUrl} lines in, NDJSON results out")
+    parser.add_argument('--concurrency', type=int, default=BACKFILL_CONCURRENCY, help="Backfill: images in flight")
+    parser.add_argument('--retries', type=int, default=BACKFILL_RETRIES, help="Backfill: extra passes over failures")
+    args = parser.parse_args()
+
+    if args.backfill:
+        stats = backfill(sys.stdin, sys.stdout, args.concurrency, args.retries)
+        print(json.dumps({"pixel_backfill": stats}), file=sys.stderr)
+        return
 
-if __name__ == "__main__":
     try:
         input_data = sys.stdin.read()
         request = json.loads(input_data)
@@ -41,3 +223,6 @@ if __name__ == "__main__":
             print(json.dumps({"error": "No URL provided"}))
     except Exception as e:
         print(json.dumps({"error": str(e)}))
+
+if __name__ == "__main__":
+    metrics.run_main("pixel", main)
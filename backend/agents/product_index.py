@@ -0,0 +1,176 @@
+"""
+In-process BM25 index over the product catalog, used to give Pixie only the
+products relevant to the question (within a token budget) instead of an
+arbitrary slice of the inventory.
+
+The index is kept at module level, so a resident worker builds it once and
+then only re-indexes products whose fields changed; in worker mode the server
+sends it the whole catalog once and afterwards only the products that changed
+(see the `catalog` worker method). Worker threads share it, so every read and
+write goes through the index's lock.
+"""
+import os
+import re
+import json
+import math
+import heapq
+import threading
+from collections import Counter, defaultdict
+
+TOP_K = int(os.getenv("PIXIE_CONTEXT_TOP_K", "8"))
+TOKEN_BUDGET = int(os.getenv("PIXIE_CONTEXT_TOKENS", "600"))
+
+# Fields Pixie gets to see for each product
+CONTEXT_FIELDS = ("title", "designer", "category", "price", "trendScore", "aiTags")
+SEARCH_FIELDS = ("title", "designer", "category", "aiTags")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def product_id(product):
+    return str(product.get("_id") or product.get("id") or product.get("title"))
+
+
+def compact(product):
+    """
+    Only the fields Pixie needs, without empties, as a small dict.
+    """
+    return {f: product[f] for f in CONTEXT_FIELDS if product.get(f) not in (None, "", [])}
+
+
+def change_key(product):
+    """
+    The raw context fields as a tuple: equal keys mean nothing Pixie sees has
+    changed, so the product needn't be compacted or re-tokenized.
+    """
+    return tuple(product.get(f) for f in CONTEXT_FIELDS)
+
+
+def estimate_tokens(text):
+    # ~4 characters per token is close enough for budgeting English/JSON
+    return len(text) // 4 + 1
+
+
+class ProductIndex:
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = {}                      # id -> (change key, length, compact product)
+        self.postings = defaultdict(dict)   # term -> {id: term frequency}
+        self.total_length = 0
+        # Re-entrant so sync() can call upsert()/remove() while holding it
+        self.lock = threading.RLock()
+
+    def _text(self, product):
+        parts = []
+        for field in SEARCH_FIELDS:
+            value = product.get(field)
+            parts.extend(value if isinstance(value, list) else [value])
+        return " ".join(str(v) for v in parts if v)
+
+    def upsert(self, product):
+        doc_id = product_id(product)
+        key = change_key(product)
+        with self.lock:
+            entry = self.docs.get(doc_id)
+            if entry is not None and entry[0] == key:
+                return
+            self.remove(doc_id)
+            item = compact(product)
+            terms = Counter(tokenize(self._text(product)))
+
+            for term, tf in terms.items():
+                self.postings[term][doc_id] = tf
+            length = sum(terms.values())
+            self.docs[doc_id] = (key, length, item)
+            self.total_length += length
+
+    def remove(self, doc_id):
+        with self.lock:
+            entry = self.docs.pop(doc_id, None)
+            if entry is None:
+                return
+            _, length, item = entry
+            self.total_length -= length
+            for term in set(tokenize(self._text(item))):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    def sync(self, products, prune=True):
+        """
+        Brings the index in line with a catalog snapshot: new or changed
+        products are (re)indexed, and with prune=True missing ones are dropped.
+        """
+        with self.lock:
+            seen = set()
+            for product in products:
+                self.upsert(product)
+                seen.add(product_id(product))
+            if prune:
+                for doc_id in [d for d in self.docs if d not in seen]:
+                    self.remove(doc_id)
+
+    def search(self, query, k=TOP_K):
+        """
+        Returns up to k (score, compact product) pairs, best first.
+        """
+        terms = set(tokenize(query or ""))
+        with self.lock:
+            if not self.docs:
+                return []
+            n = len(self.docs)
+            avg_length = self.total_length / n or 1
+            scores = defaultdict(float)
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    length = self.docs[doc_id][1]
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / (
+                        tf + self.k1 * (1 - self.b + self.b * length / avg_length)
+                    )
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(score, self.docs[doc_id][2]) for doc_id, score in best]
+
+    def trending(self, k=TOP_K):
+        """
+        Returns up to k compact products with the highest trendScore.
+        """
+        with self.lock:
+            return heapq.nlargest(k, (entry[2] for entry in self.docs.values()),
+                                  key=lambda item: item.get("trendScore") or 0)
+
+
+# Shared across calls in a resident worker
+index = ProductIndex()
+
+
+def select_context(products, query, top_k=TOP_K, token_budget=TOKEN_BUDGET):
+    """
+    Picks the products most relevant to `query` that fit in `token_budget`.
+    Falls back to the highest trendScore items when nothing matches.
+    """
+    if products:
+        index.sync(products)
+
+    ranked = [item for _, item in index.search(query, top_k)]
+    if not ranked:
+        ranked = index.trending(top_k)
+
+    selected, used = [], 2
+    for item in ranked:
+        cost = estimate_tokens(json.dumps(item, separators=(",", ":"), default=str)) + 1
+        if used + cost > token_budget:
+            break
+        selected.append(item)
+        used += cost
+    return selected
@@ -1,48 +1,92 @@
+import os
 import sys
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from utils_openrouter import query_openrouter
 from vogue import ask_vogue
 from ledger import ask_ledger
 from echo import ask_echo
+import metrics
 
 # SEYNA: Uses Llama 3.2 3B (Free, Fast, Reliable)
 MODEL = "meta-llama/llama-3.2-3b-instruct:free"
 
+# Per-agent deadline in seconds (override with SEYNA_AGENT_TIMEOUT)
+AGENT_TIMEOUT = float(os.getenv("SEYNA_AGENT_TIMEOUT", "45"))
+
+# The agents' own fallback chains stop this much earlier, so a chain that
+# runs out of time is reported as such rather than racing our deadline
+DEADLINE_MARGIN = 1.0
+
+# Shared pool so a resident worker reuses threads across commands
+executor = ThreadPoolExecutor(max_workers=int(os.getenv("SEYNA_MAX_THREADS", "8")))
+
+def ask_seyna(goal, timeout=None):
+    system_prompt = "You are SEYNA, the AI Supervisor. Briefly acknowledge the goal and delegate."
+    return query_openrouter(MODEL, system_prompt, goal, timeout=timeout, agent="seyna", raise_errors=True)
+
+# (agent, role, function, deadline)
+TEAM = [
+    ("Seyna", "Supervisor", ask_seyna, AGENT_TIMEOUT),
+    ("Vogue", "Creative", ask_vogue, AGENT_TIMEOUT),
+    ("Ledger", "Finance", ask_ledger, AGENT_TIMEOUT),
+    ("Echo", "Marketing", ask_echo, AGENT_TIMEOUT),
+]
+
+def run_command(goal, team=TEAM):
+    """
+    Runs one Seyna strategy meeting for the given goal and returns the report.
+    Seyna and the sub-agents run concurrently, each with its own deadline;
+    agents that miss it are reported with status "timeout", agents whose
+    every model failed with status "error".
+    """
+    report = {
+        "seyna_status": "Orchestrating Agents via OpenRouter...",
+        "team_reports": []
+    }
+
+    # 1. Fan out Seyna's plan and every sub-agent at once
+    started = time.monotonic()
+    futures = [
+        (agent, role, deadline, executor.submit(ask, goal, timeout=max(deadline - DEADLINE_MARGIN, deadline / 2)))
+        for agent, role, ask, deadline in team
+    ]
+
+    # 2. Collect in team order; each agent only gets what is left of its own deadline
+    for agent, role, deadline, future in futures:
+        entry = {"agent": agent, "role": role}
+        try:
+            entry["output"] = future.result(timeout=max(0, started + deadline - time.monotonic()))
+            entry["status"] = "ok"
+        except FutureTimeout:
+            future.cancel()
+            entry["output"] = f"{agent} did not report back within {deadline:g}s."
+            entry["status"] = "timeout"
+        except Exception as e:
+            # The agent's whole fallback chain failed (or ran out of time)
+            if metrics.outcome_of(e) == "timeout":
+                entry["output"] = f"{agent} did not report back within {deadline:g}s."
+                entry["status"] = "timeout"
+            else:
+                entry["output"] = f"{agent} failed: {str(e)}"
+                entry["status"] = "error"
+        entry["elapsed_ms"] = round((time.monotonic() - started) * 1000)
+        report['team_reports'].append(entry)
+
+    if any(r["status"] != "ok" for r in report['team_reports']):
+        report["seyna_status"] = "Partial report: some agents did not finish."
+
+    return report
+
 def main():
     try:
         input_data = sys.stdin.read()
         request = json.loads(input_data)
-        goal = request.get('goal')
-        
-        report = {
-            "seyna_status": "Orchestrating Agents via OpenRouter...",
-            "team_reports": []
-        }
-
-        # 1. Seyna Thinks (Plan)
-        system_prompt = "You are SEYNA, the AI Supervisor. Briefly acknowledge the goal and delegate."
-        seyna_output = query_openrouter(MODEL, system_prompt, goal)
-        report['team_reports'].append({"agent": "Seyna", "role": "Supervisor", "output": seyna_output})
-        
-        # 2. Call Sub-Agents (Parallel Execution)
-        # In a real async app, these would run in parallel. Here we run sequential for simplicity.
-        
-        report['team_reports'].append({
-            "agent": "Vogue", "role": "Creative", "output": ask_vogue(goal)
-        })
-        
-        report['team_reports'].append({
-            "agent": "Ledger", "role": "Finance", "output": ask_ledger(goal)
-        })
-
-        report['team_reports'].append({
-            "agent": "Echo", "role": "Marketing", "output": ask_echo(goal)
-        })
-
-        print(json.dumps(report))
+        print(json.dumps(run_command(request.get('goal'))))
 
     except Exception as e:
         print(json.dumps({"error": str(e)}))
 
 if __name__ == "__main__":
-    main()
+    metrics.run_main("seyna", main)
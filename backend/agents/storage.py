@@ -0,0 +1,67 @@
+"""
+Local state shared between short-lived agent processes (model health,
+caches, job checkpoints). Everything lives under backend/.cache unless
+AGENT_CACHE_DIR says otherwise.
+"""
+import os
+import json
+import tempfile
+from contextlib import contextmanager
+import env
+
+# Every agent module reads its settings at import, and they all import this first
+env.load()
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, last writer wins
+    fcntl = None
+
+CACHE_DIR = os.getenv(
+    "AGENT_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache"),
+)
+
+def cache_path(name):
+    """
+    Returns the path of a file inside the cache dir, creating the dir if needed.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, name)
+
+@contextmanager
+def file_lock(path):
+    """
+    Holds an exclusive lock on `path + ".lock"` for the duration of the block.
+    """
+    with open(path + ".lock", "a") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def read_json(path, default=None):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def write_json_atomic(path, data):
+    """
+    Writes JSON to a temp file and renames it over `path`, so readers never
+    see a half-written file.
+    """
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
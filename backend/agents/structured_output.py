@@ -0,0 +1,230 @@
+"""
+Tolerant structured (JSON) output for agents.
+
+Models wrap JSON in prose, add trailing commas, use single quotes or
+Python literals, or return two objects. Rather than throwing that paid
+completion away, this module:
+  1. tells callers whether a model supports JSON mode (response_format),
+  2. finds the first balanced JSON value in the text and repairs common defects,
+  3. validates it against a small per-agent schema (with light coercion),
+  4. only as a last resort asks for a repair with a short follow-up prompt.
+"""
+import re
+import ast
+import json
+
+# OpenRouter models that honour response_format={"type": "json_object"}
+JSON_MODE_PREFIXES = ("google/gemini", "openai/", "mistralai/")
+
+JSON_MODE = {"type": "json_object"}
+
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+class StructuredOutputError(ValueError):
+    def __init__(self, errors, raw_text):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+        self.raw_text = raw_text
+
+
+def supports_json_mode(model):
+    return model.startswith(JSON_MODE_PREFIXES)
+
+
+def _balanced_candidates(text):
+    """
+    Yields every balanced {...} / [...] span, outermost first, in order.
+    """
+    start = 0
+    while True:
+        positions = [p for p in (text.find("{", start), text.find("[", start)) if p != -1]
+        if not positions:
+            return
+        begin = min(positions)
+        depth, in_string, escaped, quote = 0, False, False, None
+        for i in range(begin, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == quote:
+                    in_string = False
+            elif ch in "\"'":
+                in_string, quote = True, ch
+            elif ch in "{[":
+                depth += 1
+            elif ch in "}]":
+                depth -= 1
+                if depth == 0:
+                    yield text[begin:i + 1]
+                    start = i + 1
+                    break
+        else:
+            # Unbalanced to the end (e.g. truncated): try closing what's open
+            yield text[begin:]
+            return
+
+
+def _repair(candidate):
+    candidate = candidate.translate(SMART_QUOTES)
+    return TRAILING_COMMA.sub(r"\1", candidate)
+
+
+def _close_truncated(candidate):
+    stack = []
+    in_string, escaped = False, False
+    for ch in candidate:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    return candidate + ('"' if in_string else "") + "".join(reversed(stack))
+
+
+def _loads(candidate):
+    for attempt in (candidate, _repair(candidate), _close_truncated(_repair(candidate))):
+        try:
+            return json.loads(attempt)
+        except ValueError:
+            pass
+    # Single quotes / True / None: valid Python literal, not JSON
+    try:
+        pythonish = re.sub(r"\btrue\b", "True", re.sub(r"\bfalse\b", "False", re.sub(r"\bnull\b", "None", _repair(candidate))))
+        value = ast.literal_eval(pythonish)
+        if isinstance(value, (dict, list)):
+            return value
+    except (ValueError, SyntaxError):
+        pass
+    raise ValueError("no parsable JSON")
+
+
+def extract_json(text, expect=None):
+    """
+    Returns the first JSON object/array found in `text` (optionally of type
+    `expect`), repairing common defects. Raises ValueError if there is none.
+    """
+    if not isinstance(text, str):
+        raise ValueError("no text to parse")
+    text = text.replace("```json", "").replace("```", "").strip()
+    try:
+        value = json.loads(text)
+        if expect is None or isinstance(value, expect):
+            return value
+    except ValueError:
+        pass
+
+    for candidate in _balanced_candidates(text):
+        try:
+            value = _loads(candidate)
+        except ValueError:
+            continue
+        if expect is None or isinstance(value, expect):
+            return value
+        # e.g. {"items": [...]} when a list was asked for
+        if expect is list and isinstance(value, dict):
+            lists = [v for v in value.values() if isinstance(v, list)]
+            if len(lists) == 1:
+                return lists[0]
+    raise ValueError("no JSON found in model output")
+
+
+def _coerce(value, spec):
+    kind = spec.get("type", str)
+    if kind in (int, float):
+        if isinstance(value, bool):
+            return None, "must be a number"
+        if isinstance(value, str):
+            try:
+                value = float(value.strip().rstrip("%"))
+            except ValueError:
+                return None, "must be a number"
+        if not isinstance(value, (int, float)):
+            return None, "must be a number"
+        if "min" in spec and value < spec["min"] or "max" in spec and value > spec["max"]:
+            return None, f"must be between {spec.get('min')} and {spec.get('max')}"
+        return (int(round(value)) if kind is int else float(value)), None
+    if kind is list:
+        if isinstance(value, str):
+            value = [v.strip() for v in value.split(",") if v.strip()]
+        if not isinstance(value, list):
+            return None, "must be a list"
+        return [str(v) for v in value if v not in (None, "")], None
+    if isinstance(value, (dict, list)):
+        return None, "must be a string"
+    value = str(value).strip()
+    if not value and spec.get("required"):
+        return None, "must not be empty"
+    return value, None
+
+
+def validate(data, schema):
+    """
+    Checks a parsed object against `schema` ({field: {"type", "required",
+    "min", "max", "default"}}). Returns (clean_dict, errors).
+    """
+    if not isinstance(data, dict):
+        return None, ["expected a JSON object"]
+    clean, errors = {}, []
+    for field, spec in schema.items():
+        value = data.get(field)
+        if value is None:
+            if spec.get("required"):
+                errors.append(f"missing '{field}'")
+            elif "default" in spec:
+                clean[field] = spec["default"]
+            continue
+        value, error = _coerce(value, spec)
+        if error:
+            errors.append(f"'{field}' {error}")
+        else:
+            clean[field] = value
+    return clean, errors
+
+
+def example(schema):
+    """
+    A compact JSON skeleton of the schema for prompts.
+    """
+    placeholders = {int: 0, float: 0.0, list: [], str: ""}
+    return json.dumps({f: placeholders.get(spec.get("type", str), "") for f, spec in schema.items()})
+
+
+def repair_prompt(raw_text, errors, schema):
+    return (
+        "Your previous answer could not be used (" + "; ".join(errors) + ").\n"
+        "Previous answer:\n" + str(raw_text)[:2000] + "\n\n"
+        "Reply with ONLY one valid JSON object with these fields: " + example(schema)
+    )
+
+
+def parse_structured(raw_text, schema, repair=None):
+    """
+    Extracts and validates one object from `raw_text`. If that fails and a
+    `repair(prompt) -> text` callback is given, asks once for a fix.
+    Raises StructuredOutputError when nothing usable comes back.
+    """
+    errors = []
+    for attempt in range(2):
+        try:
+            clean, errors = validate(extract_json(raw_text, expect=dict), schema)
+            if not errors:
+                return clean
+        except ValueError as e:
+            errors = [str(e)]
+        if attempt or repair is None:
+            break
+        raw_text = repair(repair_prompt(raw_text, errors, schema))
+    raise StructuredOutputError(errors, raw_text)
@@ -0,0 +1,96 @@
+"""
+Per-product state for the incremental trend job (ai_trend.py --job).
+
+Each product's prompt-relevant fields (title, designer, category, price) are
+fingerprinted; the fingerprint, the analysis and when it was made are kept in
+SQLite. A product is only re-analyzed when it is new, its fingerprint
+changed, or its analysis expired. Results are committed batch by batch, so an
+interrupted job resumes where it stopped: finished products simply match.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from storage import cache_path
+
+STATE_PATH = os.getenv("TREND_STATE_PATH") or cache_path("trend_state.sqlite3")
+
+# Re-analyze unchanged products after this many days anyway (trends move)
+MAX_AGE_DAYS = float(os.getenv("TREND_REFRESH_DAYS", "30"))
+
+FINGERPRINT_FIELDS = ("title", "designer", "category", "price")
+
+# Why a product needs (or doesn't need) a new analysis
+NEW, CHANGED, EXPIRED, FRESH = "new", "changed", "expired", "fresh"
+
+
+def fingerprint(product):
+    fields = [product.get(f) for f in FINGERPRINT_FIELDS]
+    return hashlib.sha256(json.dumps(fields, default=str).encode("utf-8")).hexdigest()[:32]
+
+
+class TrendState:
+    def __init__(self, path=STATE_PATH, max_age_days=MAX_AGE_DAYS):
+        self.max_age = max_age_days * 86400
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            " id TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, analyzed_at REAL NOT NULL, analysis TEXT NOT NULL)"
+        )
+
+    def lookup(self, ids):
+        """
+        {id: (fingerprint, analyzed_at, analysis)} for the ids that have state.
+        """
+        found = {}
+        ids = list(ids)
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT id, fingerprint, analyzed_at, analysis FROM products WHERE id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for pid, fp, analyzed_at, analysis in rows:
+                found[pid] = (fp, analyzed_at, json.loads(analysis))
+        return found
+
+    def classify(self, product, entry, now=None):
+        """
+        NEW / CHANGED / EXPIRED (needs analysis) or FRESH for one product.
+        """
+        if entry is None:
+            return NEW
+        fp, analyzed_at, _ = entry
+        if fp != fingerprint(product):
+            return CHANGED
+        if (now or time.time()) - analyzed_at > self.max_age:
+            return EXPIRED
+        return FRESH
+
+    def save(self, analyses, products_by_id, analyzed_at=None):
+        """
+        Checkpoints {id: analysis} in one transaction.
+        """
+        analyzed_at = analyzed_at or time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO products (id, fingerprint, analyzed_at, analysis) VALUES (?, ?, ?, ?)",
+                [(pid, fingerprint(products_by_id[pid]), analyzed_at, json.dumps(analysis))
+                 for pid, analysis in analyses.items()],
+            )
+
+    def prune(self, keep_ids):
+        """
+        Drops state for products that are no longer in the catalog.
+        """
+        keep = set(keep_ids)
+        stale = [pid for (pid,) in self.conn.execute("SELECT id FROM products") if pid not in keep]
+        with self.conn:
+            self.conn.executemany("DELETE FROM products WHERE id = ?", [(pid,) for pid in stale])
+        return len(stale)
+
+    def close(self):
+        self.conn.close()
@@ -1,16 +1,336 @@
 import os
 import sys
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+import time
+import heapq
+import random
+import itertools
+import threading
+import env
+import model_health
+import llm_cache
+import metrics
 
-load_dotenv()
+# The openai SDK (and httpx) take most of a second to import, so they are
+# only imported when the first request is actually sent; cache hits never pay.
+# asyncio is likewise only imported by the async helpers.
+env.load()
 
-# Initialize the client pointing to OpenRouter
-client = OpenAI(
-  base_url="https://openrouter.ai/api/v1",
-  api_key=os.getenv("OPENROUTER_API_KEY"),
-)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+
+# Connection pool + timeouts, shared by the sync and async clients
+MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_KEEPALIVE", "10"))
+KEEPALIVE_EXPIRY = float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", "30"))
+CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "60"))
+
+# Default number of in-flight requests for the batch helper
+BATCH_CONCURRENCY = int(os.getenv("OPENROUTER_BATCH_CONCURRENCY", "8"))
+
+# Rate limits (requests/minute) enforced locally before we hit OpenRouter's
+MODEL_RPM = float(os.getenv("OPENROUTER_MODEL_RPM", "20"))
+KEY_RPM = float(os.getenv("OPENROUTER_KEY_RPM", "60"))
+BURST = float(os.getenv("OPENROUTER_BURST", "5"))
+
+# 429 handling: wait and retry the same model if Retry-After is at most this
+# many seconds (else move down the chain), at most MAX_RATE_LIMIT_RETRIES times
+MAX_RETRY_AFTER = float(os.getenv("OPENROUTER_MAX_RETRY_AFTER", "10"))
+MAX_RATE_LIMIT_RETRIES = int(os.getenv("OPENROUTER_RATE_LIMIT_RETRIES", "2"))
+
+# Hedged requests (off unless OPENROUTER_HEDGE=1 or hedge=True): if the model
+# in flight hasn't answered within its recent HEDGE_PERCENTILE latency
+# (HEDGE_DELAY while unknown), the next healthy fallback is sent the same
+# request and the first answer wins. HEDGE_BUDGET caps hedges at that
+# fraction of requests (plus a burst of HEDGE_BURST).
+HEDGE_ENABLED = os.getenv("OPENROUTER_HEDGE", "").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("OPENROUTER_HEDGE_PERCENTILE", "90"))
+HEDGE_DELAY = float(os.getenv("OPENROUTER_HEDGE_DELAY", "5"))
+HEDGE_MIN_DELAY = float(os.getenv("OPENROUTER_HEDGE_MIN_DELAY", "0.25"))
+HEDGE_BUDGET = float(os.getenv("OPENROUTER_HEDGE_BUDGET", "0.1"))
+HEDGE_BURST = float(os.getenv("OPENROUTER_HEDGE_BURST", "3"))
+
+def _http_options():
+    import httpx
+    return {
+        "limits": httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+    }
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    """
+    Returns the shared OpenAI client pointing to OpenRouter, creating it on first use.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                from openai import OpenAI
+                _client = OpenAI(
+                    base_url=OPENROUTER_BASE_URL,
+                    api_key=os.getenv("OPENROUTER_API_KEY"),
+                    http_client=httpx.Client(**_http_options()),
+                    max_retries=0,  # retries/backoff are handled by the scheduler below
+                )
+    return _client
+
+# The async client is bound to the event loop that created it
+_async_client = None
+_async_client_loop = None
+
+def get_async_client():
+    """
+    Returns the shared AsyncOpenAI client for the running event loop.
+    """
+    global _async_client, _async_client_loop
+    import asyncio
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client_loop is not loop:
+        import httpx
+        from openai import AsyncOpenAI
+        _async_client = AsyncOpenAI(
+            base_url=OPENROUTER_BASE_URL,
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            http_client=httpx.AsyncClient(**_http_options()),
+            max_retries=0,
+        )
+        _async_client_loop = loop
+    return _async_client
+
+async def close_async_client():
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.close()
+    _async_client = None
+    _async_client_loop = None
+
+# --- Request scheduling ---
+
+# Priority classes: interactive requests (Pixie, Seyna) jump ahead of batch work
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITY_RANK = {INTERACTIVE: 0, BATCH: 1}
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, capacity):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def wait_time(self, now):
+        """
+        Seconds until one token is available (0 if one is available now).
+        """
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        # After a block, refilling starts from the end of the block
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds):
+        # Honour a Retry-After: nothing goes out before then, one request goes
+        # out as soon as it ends, and no burst after that
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 1
+        self.updated = self.blocked_until
+
+class _Ticket:
+    __slots__ = ("rank", "seq", "model", "key", "priority", "enqueued", "granted")
+
+    def __init__(self, rank, seq, model, key, priority):
+        self.rank, self.seq, self.model, self.key, self.priority = rank, seq, model, key, priority
+        self.enqueued = time.monotonic()
+        self.granted = False
+
+    def __lt__(self, other):
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+class RequestScheduler:
+    """
+    Token buckets per model and per API key, shared by every OpenRouter call
+    in this process. Waiting requests are granted in priority order (then
+    FIFO) per model, so a batch backlog never delays an interactive call by
+    more than the rate limit itself. Cross-process cooldowns from 429s live
+    in model_health.
+    """
+
+    def __init__(self, model_rpm=MODEL_RPM, key_rpm=KEY_RPM, burst=BURST):
+        self.model_rpm, self.key_rpm, self.burst = model_rpm, key_rpm, burst
+        self.model_buckets = {}
+        self.key_buckets = {}
+        self.waiting = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.stats_by_priority = {}
+        self.rate_limited = 0
+
+    def _bucket(self, buckets, name, rpm):
+        if name not in buckets:
+            buckets[name] = TokenBucket(rpm, self.burst)
+        return buckets[name]
+
+    def enqueue(self, model, priority=INTERACTIVE, key=None):
+        with self.cond:
+            ticket = _Ticket(PRIORITY_RANK.get(priority, 1), next(self.seq), model, key or "default", priority)
+            heapq.heappush(self.waiting, ticket)
+            return ticket
+
+    def poll(self, ticket):
+        """
+        Grants whatever can go now. Returns (granted, seconds to wait before
+        polling again).
+        """
+        with self.cond:
+            next_wait = self._dispatch()
+            return ticket.granted, next_wait
+
+    def _dispatch(self):
+        now = time.monotonic()
+        next_wait = None
+        granted_any = False
+        claimed_models = set()
+        key_blocked = set()
+        for ticket in sorted(self.waiting):
+            # Only the best-ranked waiter per model / per key may take a token
+            if ticket.model in claimed_models or ticket.key in key_blocked:
+                continue
+            claimed_models.add(ticket.model)
+            model_bucket = self._bucket(self.model_buckets, ticket.model, self.model_rpm)
+            key_bucket = self._bucket(self.key_buckets, ticket.key, self.key_rpm)
+            wait = max(model_bucket.wait_time(now), key_bucket.wait_time(now))
+            if wait > 0:
+                if key_bucket.wait_time(now) > 0:
+                    key_blocked.add(ticket.key)
+                next_wait = wait if next_wait is None else min(next_wait, wait)
+                continue
+            model_bucket.take()
+            key_bucket.take()
+            ticket.granted = True
+            granted_any = True
+            self.waiting.remove(ticket)
+            self._record_wait(ticket, now)
+        if granted_any:
+            heapq.heapify(self.waiting)
+            self.cond.notify_all()
+        return next_wait if next_wait is not None else 0.05
+
+    def _record_wait(self, ticket, now):
+        waited = now - ticket.enqueued
+        stats = self.stats_by_priority.setdefault(ticket.priority, {"granted": 0, "wait_total": 0.0, "wait_max": 0.0})
+        stats["granted"] += 1
+        stats["wait_total"] += waited
+        stats["wait_max"] = max(stats["wait_max"], waited)
+
+    def cancel(self, ticket):
+        with self.cond:
+            if ticket in self.waiting:
+                self.waiting.remove(ticket)
+                heapq.heapify(self.waiting)
+            self.cond.notify_all()
+
+    def acquire(self, model, priority=INTERACTIVE, key=None, timeout=None):
+        """
+        Blocks until a request to `model` may be sent. Raises TimeoutError
+        if that takes longer than `timeout` seconds.
+        """
+        ticket = self.enqueue(model, priority, key)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.cond:
+            while True:
+                wait = self._dispatch()
+                if ticket.granted:
+                    return
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.cancel(ticket)
+                    raise TimeoutError(f"Waited too long for a {model} rate-limit slot")
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                self.cond.wait(max(wait, 0.001))
+
+    async def acquire_async(self, model, priority=INTERACTIVE, key=None, timeout=None):
+        import asyncio
+        ticket = self.enqueue(model, priority, key)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        try:
+            while True:
+                granted, wait = self.poll(ticket)
+                if granted:
+                    return
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise TimeoutError(f"Waited too long for a {model} rate-limit slot")
+                await asyncio.sleep(min(max(wait, 0.001), 0.25))
+        except BaseException:
+            self.cancel(ticket)
+            raise
+
+    def penalize(self, model, seconds, key=None):
+        """
+        Blocks a model (after a 429) for `seconds`.
+        """
+        with self.cond:
+            self.rate_limited += 1
+            self._bucket(self.model_buckets, model, self.model_rpm).block(seconds)
+            self.cond.notify_all()
+
+    def stats(self):
+        """
+        Queue depth and wait times per priority class.
+        """
+        with self.cond:
+            depth = {}
+            for ticket in self.waiting:
+                depth[ticket.priority] = depth.get(ticket.priority, 0) + 1
+            return {
+                "queue_depth": depth,
+                "rate_limited": self.rate_limited,
+                "priorities": {
+                    name: {
+                        "granted": s["granted"],
+                        "avg_wait_ms": round(s["wait_total"] / s["granted"] * 1000, 1) if s["granted"] else 0,
+                        "max_wait_ms": round(s["wait_max"] * 1000, 1),
+                    }
+                    for name, s in self.stats_by_priority.items()
+                },
+            }
+
+scheduler = RequestScheduler()
+
+def _rate_limit_delay(error, retry):
+    """
+    How long to hold off a model after a 429: Retry-After if given, else
+    exponential backoff, plus jitter so waiting callers don't stampede.
+    """
+    retry_after = _retry_after(error)
+    base = retry_after if retry_after is not None else min(2 ** retry, 30)
+    return base + random.uniform(0, 0.25 + base * 0.2)
+
+def _should_retry(model, error, retry):
+    """
+    On a 429, blocks the model in the scheduler and says whether the same
+    model is worth waiting for (short Retry-After) or we should fall back.
+    """
+    if not model_health.is_rate_limit_error(error):
+        return False
+    delay = _rate_limit_delay(error, retry)
+    scheduler.penalize(model, delay)
+    return retry < MAX_RATE_LIMIT_RETRIES and delay <= MAX_RETRY_AFTER
+
+def _api_key_id():
+    return (os.getenv("OPENROUTER_API_KEY") or "")[-8:]
 
 # List of free models to try in order if the primary fails
 FALLBACK_MODELS = [
@@ -20,62 +340,587 @@ FALLBACK_MODELS = [
     "huggingfaceh4/zephyr-7b-beta:free",
 ]
 
-def query_openrouter(model, system_prompt, user_input, max_tokens=1000):
+def _extra_headers():
+    return {
+        "HTTP-Referer": os.getenv("SITE_URL", "http://localhost:3000"),
+        "X-Title": os.getenv("SITE_NAME", "FashFolio"),
+    }
+
+def _models_to_try(model):
+    # Start with the requested model, then fallbacks (removing duplicates)
+    return [model] + [m for m in FALLBACK_MODELS if m != model]
+
+def _retry_after(error):
     """
-    Sends a text-only query to OpenRouter with automatic fallback.
+    Seconds from a Retry-After header on an API error, if there is one.
+    """
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _record_failure(model, error):
+    model_health.record_failure(
+        model,
+        rate_limited=model_health.is_rate_limit_error(error),
+        retry_after=_retry_after(error),
+    )
+
+def _cache_lookup(use_cache, model, system_prompt, user_input, **params):
+    """
+    Returns (cache_key, cached_value); the key is None when caching is off.
+    """
+    if not use_cache:
+        return None, None
+    cache_key = llm_cache.make_key(model, system_prompt, user_input, **params)
+    return cache_key, llm_cache.get(cache_key)
+
+def _text_messages(system_prompt, user_input):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_input},
+    ]
+
+def _vision_messages(system_prompt, image_url):
+    return [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": system_prompt},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": image_url}
+                }
+            ]
+        }
+    ]
+
+def _remaining(deadline):
+    """
+    Seconds left before `deadline` (None = no deadline); raises once it passed.
+    """
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise TimeoutError("Deadline exceeded")
+    return remaining
+
+def _optional(**params):
+    # Only the parameters that are set, so the SDK's defaults apply otherwise
+    return {name: value for name, value in params.items() if value is not None}
+
+def _record_attempt(agent, model, attempt, started, usage=None, error=None):
+    """
+    Records one attempt in model_health and metrics. Streams record their
+    success themselves once the last chunk (and its usage) is in.
+    """
+    latency = time.monotonic() - started
+    if error is not None:
+        _record_failure(model, error)
+        metrics.record(agent, model, attempt, latency, metrics.outcome_of(error))
+        return
+    model_health.record_success(model, latency)
+    prompt_tokens, completion_tokens = metrics.usage_tokens(usage)
+    metrics.record(agent, model, attempt, latency, "ok", prompt_tokens, completion_tokens)
+
+def _call_model(model, priority, deadline, send, agent=None, attempt=0, streaming=False):
+    """
+    Sends one request to `model` through the scheduler, waiting out short
+    Retry-Afters on 429s. `send(remaining_seconds)` makes the actual API call.
+    `attempt` is the model's position in the fallback chain (for metrics).
+    Records the outcome and re-raises the final error.
+    """
+    for retry in range(MAX_RATE_LIMIT_RETRIES + 1):
+        scheduler.acquire(model, priority, _api_key_id(), timeout=_remaining(deadline))
+        started = time.monotonic()
+        try:
+            result = send(_remaining(deadline))
+        except Exception as e:
+            _record_attempt(agent, model, attempt, started, error=e)
+            if _should_retry(model, e, retry):
+                print(f"⏳ Model {model} rate limited, retrying after backoff...", file=sys.stderr)
+                continue
+            raise
+        if not streaming:
+            _record_attempt(agent, model, attempt, started, usage=getattr(result, "usage", None))
+        return result
+
+async def _call_model_async(model, priority, deadline, send, agent=None, attempt=0):
+    """
+    Async version of _call_model; `send` returns an awaitable.
+    """
+    for retry in range(MAX_RATE_LIMIT_RETRIES + 1):
+        await scheduler.acquire_async(model, priority, _api_key_id(), timeout=_remaining(deadline))
+        started = time.monotonic()
+        try:
+            result = await send(_remaining(deadline))
+        except Exception as e:
+            _record_attempt(agent, model, attempt, started, error=e)
+            if _should_retry(model, e, retry):
+                print(f"⏳ Model {model} rate limited, retrying after backoff...", file=sys.stderr)
+                continue
+            raise
+        _record_attempt(agent, model, attempt, started, usage=getattr(result, "usage", None))
+        return result
+
+def _call_chain(models, priority, deadline, make_send, agent=None):
+    """
+    Tries `models` in order until one answers. `make_send(model)` returns the
+    `send` for _call_model. Returns (completion, None) or (None, last_error).
     """
-    # Create a list starting with the requested model, then fallbacks (removing duplicates)
-    models_to_try = [model] + [m for m in FALLBACK_MODELS if m != model]
-    
     last_error = None
-    
-    for current_model in models_to_try:
+    for attempt, current_model in enumerate(models):
         try:
             print(f"🔄 Attempting with model: {current_model}...", file=sys.stderr)
-            completion = client.chat.completions.create(
-                extra_headers={
-                    "HTTP-Referer": os.getenv("SITE_URL", "http://localhost:3000"),
-                    "X-Title": os.getenv("SITE_NAME", "FashFolio"),
-                },
-                model=current_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_input},
-                ],
-                max_tokens=max_tokens,
-            )
-            return completion.choices[0].message.content
+            return _call_model(current_model, priority, deadline, make_send(current_model), agent, attempt), None
+        except TimeoutError as e:
+            return None, e
         except Exception as e:
             print(f"⚠️ Model {current_model} failed: {str(e)}", file=sys.stderr)
             last_error = e
+    return None, last_error
+
+async def _call_chain_async(models, priority, deadline, make_send, agent=None):
+    """
+    Async version of _call_chain.
+    """
+    last_error = None
+    for attempt, current_model in enumerate(models):
+        try:
+            print(f"🔄 Attempting with model: {current_model}...", file=sys.stderr)
+            return await _call_model_async(current_model, priority, deadline, make_send(current_model),
+                                           agent, attempt), None
+        except TimeoutError as e:
+            return None, e
+        except Exception as e:
+            print(f"⚠️ Model {current_model} failed: {str(e)}", file=sys.stderr)
+            last_error = e
+    return None, last_error
+
+# --- Hedged requests ---
+
+class HedgeBudget:
+    """
+    Keeps hedging's extra load bounded: every request earns `ratio` of a
+    hedge (at most `burst` saved up) and every hedge spends one. Also counts
+    how often hedges fire and how often the hedge answers first.
+    """
+
+    def __init__(self, ratio=HEDGE_BUDGET, burst=HEDGE_BURST):
+        self.ratio, self.burst = ratio, burst
+        self.tokens = burst
+        self.lock = threading.Lock()
+        self.counts = {"requests": 0, "fired": 0, "won": 0, "over_budget": 0}
+
+    def note_request(self):
+        with self.lock:
+            self.counts["requests"] += 1
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self, agent=None):
+        with self.lock:
+            allowed = self.tokens >= 1
+            if allowed:
+                self.tokens -= 1
+            self.counts["fired" if allowed else "over_budget"] += 1
+        metrics.record_hedge(agent, "fired" if allowed else "over_budget")
+        return allowed
+
+    def won(self, agent=None):
+        with self.lock:
+            self.counts["won"] += 1
+        metrics.record_hedge(agent, "won")
+
+    def stats(self):
+        with self.lock:
+            counts = dict(self.counts)
+        counts["fire_rate"] = round(counts["fired"] / counts["requests"], 3) if counts["requests"] else 0
+        counts["win_rate"] = round(counts["won"] / counts["fired"], 3) if counts["fired"] else 0
+        return counts
+
+hedge_budget = HedgeBudget()
+
+_hedge_pool = None
+_hedge_pool_lock = threading.Lock()
+
+def _get_hedge_pool():
+    global _hedge_pool
+    with _hedge_pool_lock:
+        if _hedge_pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _hedge_pool = ThreadPoolExecutor(max_workers=MAX_CONNECTIONS, thread_name_prefix="hedge")
+    return _hedge_pool
+
+def _hedging(hedge, models):
+    return (HEDGE_ENABLED if hedge is None else hedge) and len(models) > 1
+
+def _hedge_delay(model, state):
+    """
+    How long `model` gets before a hedge is sent: its recent p90 (by default).
+    """
+    latency = model_health.percentile(model, HEDGE_PERCENTILE, state)
+    return max(HEDGE_MIN_DELAY, latency if latency is not None else HEDGE_DELAY)
+
+def _hedge_target(pending, state):
+    """
+    Index in `pending` of the first (attempt, model) whose circuit is closed, or None.
+    """
+    for i, (_, model) in enumerate(pending):
+        if model_health.is_available(model, state):
+            return i
+    return None
+
+def _call_chain_hedged(models, priority, deadline, make_send, agent=None):
+    """
+    _call_chain with one hedge: if the model in flight is slower than its
+    hedge delay, the next healthy model gets the same request and the first
+    answer wins. A thread can't be interrupted, so the losing call finishes
+    in the background and its answer is dropped (its latency still feeds
+    model_health, i.e. future hedge delays).
+    """
+    from concurrent.futures import wait, FIRST_COMPLETED
+    pool = _get_hedge_pool()
+    state = model_health.load_state()
+    hedge_budget.note_request()
+    pending = list(enumerate(models))
+    running = {}
+
+    def start(index=0):
+        attempt, current_model = pending.pop(index)
+        print(f"🔄 Attempting with model: {current_model}...", file=sys.stderr)
+        future = pool.submit(_call_model, current_model, priority, deadline, make_send(current_model), agent, attempt)
+        running[future] = current_model
+        return current_model
+
+    hedge_at = time.monotonic() + _hedge_delay(start(), state)
+    hedge_model = None
+    last_error = None
+    while running:
+        timeout = max(hedge_at - time.monotonic(), 0) if hedge_at is not None else None
+        done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            # Still no answer: hedge once, if budget and a healthy fallback allow
+            hedge_at = None
+            target = _hedge_target(pending, state)
+            if target is not None and hedge_budget.try_spend(agent):
+                hedge_model = start(target)
+                print(f"🏁 Hedging with model: {hedge_model}...", file=sys.stderr)
             continue
-            
-    return f"All models failed. Last Error: {str(last_error)}"
+        for future in done:
+            current_model = running.pop(future)
+            try:
+                completion = future.result()
+            except TimeoutError as e:
+                # Deadline passed: whatever else is running will hit it too
+                pending.clear()
+                last_error = e
+                continue
+            except Exception as e:
+                print(f"⚠️ Model {current_model} failed: {str(e)}", file=sys.stderr)
+                last_error = e
+                continue
+            if current_model == hedge_model:
+                hedge_budget.won(agent)
+            return completion, None
+        if not running and pending:
+            # Plain fallback; a hedge not yet used may still follow it
+            next_model = start()
+            if hedge_model is None and hedge_at is not None:
+                hedge_at = time.monotonic() + _hedge_delay(next_model, state)
+    return None, last_error
+
+async def _call_chain_hedged_async(models, priority, deadline, make_send, agent=None):
+    """
+    Async version of _call_chain_hedged; here the losing request is cancelled.
+    """
+    import asyncio
+    state = model_health.load_state()
+    hedge_budget.note_request()
+    pending = list(enumerate(models))
+    running = {}
+
+    def start(index=0):
+        attempt, current_model = pending.pop(index)
+        print(f"🔄 Attempting with model: {current_model}...", file=sys.stderr)
+        task = asyncio.ensure_future(
+            _call_model_async(current_model, priority, deadline, make_send(current_model), agent, attempt))
+        running[task] = current_model
+        return current_model
+
+    hedge_at = time.monotonic() + _hedge_delay(start(), state)
+    hedge_model = None
+    last_error = None
+    try:
+        while running:
+            timeout = max(hedge_at - time.monotonic(), 0) if hedge_at is not None else None
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                hedge_at = None
+                target = _hedge_target(pending, state)
+                if target is not None and hedge_budget.try_spend(agent):
+                    hedge_model = start(target)
+                    print(f"🏁 Hedging with model: {hedge_model}...", file=sys.stderr)
+                continue
+            for task in done:
+                current_model = running.pop(task)
+                try:
+                    completion = task.result()
+                except TimeoutError as e:
+                    pending.clear()
+                    last_error = e
+                    continue
+                except Exception as e:
+                    print(f"⚠️ Model {current_model} failed: {str(e)}", file=sys.stderr)
+                    last_error = e
+                    continue
+                if current_model == hedge_model:
+                    hedge_budget.won(agent)
+                return completion, None
+            if not running and pending:
+                next_model = start()
+                if hedge_model is None and hedge_at is not None:
+                    hedge_at = time.monotonic() + _hedge_delay(next_model, state)
+        return None, last_error
+    finally:
+        # The loser (or everything, if we were cancelled ourselves)
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+def query_openrouter(model, system_prompt, user_input, max_tokens=1000, timeout=None,
+                     use_cache=True, cache_ttl=None, response_format=None, priority=INTERACTIVE, agent=None,
+                     hedge=None, raise_errors=False):
+    """
+    Sends a text-only query to OpenRouter with automatic fallback.
+    Models with an open circuit (see model_health) are tried last.
+    `timeout` (seconds) bounds the whole fallback chain, not each attempt.
+    Answers are served from / stored in llm_cache unless use_cache=False.
+    Pass response_format={"type": "json_object"} for JSON mode on models
+    that support it (see structured_output.supports_json_mode).
+    `priority` is INTERACTIVE or BATCH for the request scheduler; `agent`
+    names the caller in metrics. `hedge` turns hedged requests on or off for
+    this call (default: OPENROUTER_HEDGE). When every model fails this returns
+    an "All models failed..." string, or with raise_errors=True re-raises the
+    last error (a TimeoutError if the deadline passed).
+    """
+    cache_key, cached = _cache_lookup(use_cache, model, system_prompt, user_input,
+                                      max_tokens=max_tokens, response_format=response_format)
+    if cached is not None:
+        return cached
+
+    models_to_try = model_health.order_models(_models_to_try(model))
+    deadline = time.monotonic() + timeout if timeout else None
+    # Created (on first use: the SDK import) before any attempt computes its time left
+    client = get_client()
+
+    def make_send(current_model):
+        def send(remaining):
+            return client.chat.completions.create(
+                extra_headers=_extra_headers(),
+                model=current_model,
+                messages=_text_messages(system_prompt, user_input),
+                max_tokens=max_tokens,
+                **_optional(timeout=remaining, response_format=response_format),
+            )
+        return send
+
+    call_chain = _call_chain_hedged if _hedging(hedge, models_to_try) else _call_chain
+    completion, last_error = call_chain(models_to_try, priority, deadline, make_send, agent)
+    if completion is None:
+        if raise_errors:
+            raise last_error
+        return f"All models failed. Last Error: {str(last_error)}"
+    content = completion.choices[0].message.content
+    if cache_key:
+        llm_cache.put(cache_key, content, cache_ttl)
+    return content
 
-def query_openrouter_vision(model, system_prompt, image_url):
+def query_openrouter_vision(model, system_prompt, image_url, use_cache=True, cache_ttl=None,
+                            response_format=None, priority=INTERACTIVE, agent=None):
     """
     Sends an Image + Text query to OpenRouter (for Pixel).
     """
+    cache_key, cached = _cache_lookup(use_cache, model, system_prompt, image_url, vision=True,
+                                      response_format=response_format)
+    if cached is not None:
+        return cached
+
+    def send(remaining):
+        return get_client().chat.completions.create(
+            extra_headers=_extra_headers(),
+            model=model,
+            messages=_vision_messages(system_prompt, image_url),
+            **_optional(response_format=response_format),
+        )
     try:
-        completion = client.chat.completions.create(
-            extra_headers={
-                "HTTP-Referer": os.getenv("SITE_URL", "http://localhost:3000"),
-                "X-Title": os.getenv("SITE_NAME", "FashFolio"),
-            },
+        completion = _call_model(model, priority, None, send, agent)
+        content = completion.choices[0].message.content
+        if cache_key:
+            llm_cache.put(cache_key, content, cache_ttl)
+        return content
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+def stream_openrouter(model, system_prompt, user_input, max_tokens=1000, use_cache=True, cache_ttl=None,
+                      priority=INTERACTIVE, agent=None):
+    """
+    Streams a text-only query as it is generated. Yields
+    {"type": "delta", "content": "..."} events, then one
+    {"type": "done", "response", "model", "ttft_ms", "total_ms", "cached"}.
+    Falls back to the next model only if the current one fails before its
+    first token; a failure mid-answer yields {"type": "error"} instead.
+    """
+    started = time.monotonic()
+    cache_key, cached = _cache_lookup(use_cache, model, system_prompt, user_input, max_tokens=max_tokens)
+    if cached is not None:
+        elapsed_ms = round((time.monotonic() - started) * 1000)
+        yield {"type": "delta", "content": cached}
+        yield {"type": "done", "response": cached, "model": model,
+               "ttft_ms": elapsed_ms, "total_ms": elapsed_ms, "cached": True}
+        return
+
+    last_error = None
+    for attempt, current_model in enumerate(model_health.order_models(_models_to_try(model))):
+        def send(remaining, current_model=current_model):
+            return get_client().chat.completions.create(
+                extra_headers=_extra_headers(),
+                model=current_model,
+                messages=_text_messages(system_prompt, user_input),
+                max_tokens=max_tokens,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+        ttft_ms = None
+        parts = []
+        stream = None
+        usage = None
+        try:
+            print(f"🔄 Streaming with model: {current_model}...", file=sys.stderr)
+            attempt_started = time.monotonic()
+            stream = _call_model(current_model, priority, None, send, agent, attempt, streaming=True)
+            for chunk in stream:
+                usage = getattr(chunk, "usage", None) or usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                if ttft_ms is None:
+                    ttft_ms = round((time.monotonic() - started) * 1000)
+                parts.append(delta)
+                yield {"type": "delta", "content": delta}
+        except Exception as e:
+            print(f"⚠️ Model {current_model} failed: {str(e)}", file=sys.stderr)
+            last_error = e
+            if stream is not None:
+                # Failed after the stream opened (_call_model only saw the open)
+                _record_attempt(agent, current_model, attempt, attempt_started, error=e)
+            if ttft_ms is None:
+                continue
+            # Tokens already went out; switching models now would garble the answer
+            yield {"type": "error", "error": str(e), "model": current_model}
+            return
+
+        _record_attempt(agent, current_model, attempt, attempt_started, usage=usage)
+        response = "".join(parts)
+        if cache_key:
+            llm_cache.put(cache_key, response, cache_ttl)
+        yield {"type": "done", "response": response, "model": current_model, "ttft_ms": ttft_ms,
+               "total_ms": round((time.monotonic() - started) * 1000), "cached": False}
+        return
+
+    yield {"type": "error", "error": f"All models failed. Last Error: {str(last_error)}"}
+
+async def query_openrouter_async(model, system_prompt, user_input, max_tokens=1000, timeout=None,
+                                 use_cache=True, cache_ttl=None, response_format=None, priority=INTERACTIVE,
+                                 agent=None, hedge=None, raise_errors=False):
+    """
+    Async version of query_openrouter, using the shared pooled AsyncOpenAI client.
+    """
+    cache_key, cached = _cache_lookup(use_cache, model, system_prompt, user_input,
+                                      max_tokens=max_tokens, response_format=response_format)
+    if cached is not None:
+        return cached
+
+    models_to_try = model_health.order_models(_models_to_try(model))
+    deadline = time.monotonic() + timeout if timeout else None
+    async_client = get_async_client()
+
+    def make_send(current_model):
+        def send(remaining):
+            return async_client.chat.completions.create(
+                extra_headers=_extra_headers(),
+                model=current_model,
+                messages=_text_messages(system_prompt, user_input),
+                max_tokens=max_tokens,
+                **_optional(timeout=remaining, response_format=response_format),
+            )
+        return send
+
+    call_chain = _call_chain_hedged_async if _hedging(hedge, models_to_try) else _call_chain_async
+    completion, last_error = await call_chain(models_to_try, priority, deadline, make_send, agent)
+    if completion is None:
+        if raise_errors:
+            raise last_error
+        return f"All models failed. Last Error: {str(last_error)}"
+    content = completion.choices[0].message.content
+    if cache_key:
+        llm_cache.put(cache_key, content, cache_ttl)
+    return content
+
+async def query_openrouter_vision_async(model, system_prompt, image_url, use_cache=True, cache_ttl=None,
+                                        response_format=None, priority=INTERACTIVE, agent=None):
+    """
+    Async version of query_openrouter_vision.
+    """
+    cache_key, cached = _cache_lookup(use_cache, model, system_prompt, image_url, vision=True,
+                                      response_format=response_format)
+    if cached is not None:
+        return cached
+
+    def send(remaining):
+        return get_async_client().chat.completions.create(
+            extra_headers=_extra_headers(),
             model=model,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": system_prompt},
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": image_url}
-                        }
-                    ]
-                }
-            ],
+            messages=_vision_messages(system_prompt, image_url),
+            **_optional(response_format=response_format),
         )
-        return completion.choices[0].message.content
+    try:
+        completion = await _call_model_async(model, priority, None, send, agent)
+        content = completion.choices[0].message.content
+        if cache_key:
+            llm_cache.put(cache_key, content, cache_ttl)
+        return content
     except Exception as e:
         return f"Error: {str(e)}"
+
+async def query_openrouter_batch_async(requests, concurrency=BATCH_CONCURRENCY, max_tokens=1000, priority=BATCH,
+                                       agent=None):
+    """
+    Runs many (model, system_prompt, user_input) queries with at most
+    `concurrency` in flight. Results come back in the same order as `requests`.
+    """
+    import asyncio
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(model, system_prompt, user_input):
+        async with semaphore:
+            return await query_openrouter_async(model, system_prompt, user_input, max_tokens=max_tokens,
+                                                priority=priority, agent=agent)
+
+    return await asyncio.gather(*(run_one(*request) for request in requests))
+
+def query_openrouter_batch(requests, concurrency=BATCH_CONCURRENCY, max_tokens=1000, priority=BATCH, agent=None):
+    """
+    Blocking wrapper around query_openrouter_batch_async for scripts.
+    """
+    async def run():
+        try:
+            return await query_openrouter_batch_async(requests, concurrency, max_tokens, priority, agent)
+        finally:
+            await close_async_client()
+
+    import asyncio
+    return asyncio.run(run())
@@ -46,7 +46,8 @@ def check_connectivity():
         model = "meta-llama/llama-3.2-3b-instruct:free"
         print(f"Pinging with intended model: {model}...")
         
-        response = query_openrouter(model, "System", "Ping")
+        # Skip the cache: this is a check of the network path itself
+        response = query_openrouter(model, "System", "Ping", use_cache=False)
         
         if "Error:" in response or "failed" in response.lower():
              print(f"❌ Connectivity Failed: {response}")
@@ -0,0 +1,213 @@
+"""
+Resident agent worker.
+
+Keeps one Python interpreter (and one warm OpenRouter client) alive and serves
+agent calls over a newline-delimited JSON protocol instead of spawning a fresh
+process per request.
+
+Request:  {"id": "42", "method": "chat", "params": {...}}
+Response: {"id": "42", "ok": true, "result": {...}}
+          {"id": "42", "ok": false, "error": "..."}
+
+Methods:
+    chat    -> ai_agent.chat_with_agent   params: query, products (optional), context
+    catalog -> Pixie's resident index     params: products, replace
+    pixel   -> pixel.analyze_image        params: imageUrl
+    seyna   -> seyna.run_command          params: goal
+    score   -> ai_scoring.score_users     params: users
+    ping    -> health check (+ request scheduler queue depth / wait times, hedge stats)
+
+Requests are handled on a thread pool, so responses can come back out of
+order; callers match them up by "id".
+
+Usage (from backend/):
+    python -m agents.worker                          # stdin/stdout
+    python -m agents.worker --socket /tmp/agents.sock --workers 4
+"""
+import os
+import sys
+import json
+import socket
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+AGENTS_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(AGENTS_DIR)
+
+# Agents use flat imports (PYTHONPATH=./agents), the scripts live in backend/
+for path in (BACKEND_DIR, AGENTS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from ai_agent import chat_with_agent
+from ai_scoring import score_users
+from pixel import analyze_image
+from seyna import run_command
+from product_index import index
+from utils_openrouter import scheduler, hedge_budget, get_client
+import metrics
+
+DEFAULT_THREADS = int(os.getenv("AGENT_WORKER_THREADS", "8"))
+
+
+def _chat(params):
+    return {"response": chat_with_agent(params.get('query'), params.get('products'), params.get('context'))}
+
+def _catalog(params):
+    # Pixie's resident catalog: replace=True is the whole catalog (missing
+    # products are dropped), otherwise just the products that changed
+    index.sync(params.get('products') or [], prune=bool(params.get('replace')))
+    return {"products": len(index.docs)}
+
+def _pixel(params):
+    if not params.get('imageUrl'):
+        return {"error": "No URL provided"}
+    return analyze_image(params.get('imageUrl'))
+
+def _seyna(params):
+    return run_command(params.get('goal'))
+
+def _score(params):
+    return score_users(params.get('users') or [])
+
+def _ping(params):
+    return {"pid": os.getpid(), "scheduler": scheduler.stats(), "hedging": hedge_budget.stats()}
+
+HANDLERS = {
+    "chat": _chat,
+    "catalog": _catalog,
+    "pixel": _pixel,
+    "seyna": _seyna,
+    "score": _score,
+    "ping": _ping,
+}
+
+
+def handle_request(request):
+    """
+    Dispatches one decoded request and returns the response dict.
+    """
+    request_id = request.get('id')
+    method = request.get('method')
+    handler = HANDLERS.get(method) if isinstance(method, str) else None
+    if handler is None:
+        return {"id": request_id, "ok": False, "error": f"Unknown method: {request.get('method')}"}
+    try:
+        return {"id": request_id, "ok": True, "result": handler(request.get('params') or {})}
+    except Exception as e:
+        return {"id": request_id, "ok": False, "error": str(e)}
+
+
+def serve_stream(infile, outfile, executor, max_in_flight):
+    """
+    Reads NDJSON requests from infile until EOF and writes responses to outfile.
+    At most `max_in_flight` requests are queued or running; past that, reading
+    waits for one to finish.
+    """
+    write_lock = threading.Lock()
+    slots = threading.BoundedSemaphore(max_in_flight)
+    in_flight = set()
+    in_flight_lock = threading.Lock()
+
+    def finished(future):
+        with in_flight_lock:
+            in_flight.discard(future)
+        slots.release()
+
+    def respond(line):
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as e:
+            response = {"id": None, "ok": False, "error": f"Invalid JSON: {e}"}
+        else:
+            if isinstance(request, dict):
+                response = handle_request(request)
+            else:
+                # Valid JSON but not a request object: still answer, or the caller waits forever
+                response = {"id": None, "ok": False, "error": "Request must be a JSON object"}
+        payload = json.dumps(response) + "\n"
+        with write_lock:
+            outfile.write(payload)
+            outfile.flush()
+
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+        slots.acquire()
+        future = executor.submit(respond, line)
+        with in_flight_lock:
+            in_flight.add(future)
+        future.add_done_callback(finished)
+
+    # Drain in-flight requests before the stream closes
+    with in_flight_lock:
+        remaining = list(in_flight)
+    for future in remaining:
+        future.result()
+
+
+def serve_socket(path, threads, workers):
+    """
+    Listens on a Unix socket. With workers > 1 the listening socket is shared
+    by a small pre-forked pool of worker processes.
+    """
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen(128)
+
+    children = []
+    for _ in range(max(workers, 1) - 1):
+        pid = os.fork()
+        if pid == 0:
+            children = []
+            break
+        children.append(pid)
+
+    print(f"🟢 Agent worker {os.getpid()} listening on {path}", file=sys.stderr)
+    executor = ThreadPoolExecutor(max_workers=threads)
+
+    def serve_connection(conn):
+        with conn, conn.makefile('r', encoding='utf-8') as infile, conn.makefile('w', encoding='utf-8') as outfile:
+            serve_stream(infile, outfile, executor, threads * 2)
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=serve_connection, args=(conn,), daemon=True).start()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, 15)
+            except OSError:
+                pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FashFolio resident agent worker")
+    parser.add_argument('--socket', help="Unix socket path (default: stdin/stdout)")
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS, help="Concurrent requests per worker")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes sharing the socket")
+    args = parser.parse_args()
+
+    # Scripts create the OpenRouter client lazily; a resident worker pays once, up front
+    try:
+        get_client()
+    except Exception as e:
+        print(f"⚠️ Could not create the OpenRouter client yet: {str(e)}", file=sys.stderr)
+
+    if args.socket:
+        serve_socket(args.socket, args.threads, args.workers)
+        return
+
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        serve_stream(sys.stdin, sys.stdout, executor, args.threads * 2)
+
+
+if __name__ == "__main__":
+    metrics.run_main("worker", main)
@@ -1,11 +1,29 @@
+import os
 import sys
 import json
-from agents.utils_openrouter import query_openrouter
+
+# The agents package uses flat imports (PYTHONPATH=./agents), so make sure
+# Pixie shares the same utils_openrouter module when run from backend/.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'agents'))
+
+from utils_openrouter import query_openrouter, stream_openrouter
+from product_index import select_context, TOP_K, TOKEN_BUDGET
+import metrics
 
 # PIXIE Uses Llama 3.2 3B (Free, Fast, Reliable)
 MODEL = "meta-llama/llama-3.2-3b-instruct:free"
 
-def chat_with_agent(user_query, product_context, context_mode):
+# Chat answers only stay fresh for a few minutes
+CACHE_TTL = 300
+
+def chat_with_agent(user_query, product_context, context_mode, stream=False,
+                    top_k=TOP_K, token_budget=TOKEN_BUDGET):
+    """
+    Returns Pixie's answer, or with stream=True an iterator of NDJSON-ready
+    delta/done events (see utils_openrouter.stream_openrouter).
+    Only the top_k products most relevant to the query (and fitting in
+    token_budget) are put in the prompt.
+    """
     # Define Personas
     personas = {
         "CREATIVE_MODE": "You are 'Pixie', a trendy Gen-Z stylist. Use emojis.",
@@ -14,22 +32,32 @@ def chat_with_agent(user_query, product_context, context_mode):
     
     system_instruction = personas.get(context_mode, personas["CREATIVE_MODE"])
     
-    # Construct prompt
+    # Construct prompt with just the relevant slice of the catalog
+    inventory = select_context(product_context or [], user_query, top_k, token_budget)
     full_prompt = f"""
-    Context Inventory: {json.dumps(product_context)}
+    Context Inventory: {json.dumps(inventory, separators=(",", ":"), default=str)}
     User Query: {user_query}
     """
     
-    return query_openrouter(MODEL, system_instruction, full_prompt)
+    if stream:
+        return stream_openrouter(MODEL, system_instruction, full_prompt, cache_ttl=CACHE_TTL, agent="pixie")
+    return query_openrouter(MODEL, system_instruction, full_prompt, cache_ttl=CACHE_TTL, agent="pixie")
 
 def main():
     try:
         input_data = sys.stdin.read()
         data = json.loads(input_data)
+
+        # Streaming: one NDJSON event per line, flushed as tokens arrive
+        if data.get('stream'):
+            for event in chat_with_agent(data.get('query'), data.get('products'), data.get('context'), stream=True):
+                print(json.dumps(event), flush=True)
+            return
+
         response = chat_with_agent(data.get('query'), data.get('products'), data.get('context'))
         print(json.dumps({"response": response}))
     except Exception as e:
         print(json.dumps({"response": "Pixie is offline: " + str(e)}))
 
 if __name__ == "__main__":
-    main()
+    metrics.run_main("pixie", main)
@@ -1,5 +1,34 @@
+import os
 import sys
+import re
 import json
+import argparse
+from array import array
+
+# Shared agent metrics (agents use flat imports)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'agents'))
+import metrics
+from storage import cache_path
+
+# Streaming mode: users scored per NumPy chunk, bytes read from stdin per refill
+CHUNK_SIZE = int(os.getenv("SCORING_CHUNK_SIZE", "10000"))
+READ_SIZE = 1 << 20
+
+# Whitespace plus the commas between array items / NDJSON records
+SEPARATORS = re.compile(r'[\s,]*')
+
+# Graph mode: PageRank over the follower graph (follower -> followed)
+DAMPING = float(os.getenv("SCORING_DAMPING", "0.85"))
+RANK_TOLERANCE = float(os.getenv("SCORING_RANK_TOLERANCE", "1e-6"))
+MAX_ITERATIONS = int(os.getenv("SCORING_MAX_ITERATIONS", "100"))
+# Edges per bincount pass, so temporaries stay bounded on huge graphs
+EDGE_CHUNK = 1 << 22
+# Influence points per doubling of a user's rank over the average user, and
+# how much of the follower-count feature they replace (1.0 = all of it)
+INFLUENCE_POINTS = float(os.getenv("SCORING_INFLUENCE_POINTS", "20"))
+GRAPH_BLEND = float(os.getenv("SCORING_GRAPH_BLEND", "1.0"))
+# Last run's ranks, the warm start for the next one
+RANK_PATH = os.getenv("SCORING_RANK_PATH") or cache_path("user_rank.npz")
 
 def calculate_score(user):
     # This is where your AI/ML Logic goes.
@@ -36,7 +65,284 @@ def calculate_score(user):
         
     return score
 
+def score_users(users):
+    """
+    Attaches an "ai_score" to every user and returns the list.
+    """
+    results = []
+    for user in users:
+        # Calculate the "AI Score"
+        user['ai_score'] = calculate_score(user)
+        results.append(user)
+    return results
+
+def iter_users(stream):
+    """
+    Yields user dicts from a JSON array or NDJSON text stream, reading it in
+    READ_SIZE pieces so the whole payload never sits in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+    in_array = None
+
+    while True:
+        pos = SEPARATORS.match(buffer, pos).end()
+
+        if pos >= len(buffer):
+            if eof:
+                return
+            chunk = stream.read(READ_SIZE)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        if in_array is None:
+            in_array = buffer[pos] == '['
+            pos += 1 if in_array else 0
+            continue
+        if in_array and buffer[pos] == ']':
+            return
+
+        try:
+            user, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # Most likely the object is cut off at the end of the buffer
+            if eof:
+                raise
+            chunk = stream.read(READ_SIZE)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield user
+
+def score_chunk(users, follower_points=2):
+    """
+    Vectorized calculate_score over a list of users; returns an int64 array
+    with exactly the scores calculate_score would give (graph mode passes
+    follower_points=0 and adds its own follower feature).
+    """
+    import numpy as np
+
+    n = len(users)
+    username_len = np.fromiter((len(u.get('username', '')) for u in users), dtype=np.int64, count=n)
+    emails = [u.get('email', '') for u in users]
+    is_gmail = np.fromiter(("gmail" in e for e in emails), dtype=bool, count=n)
+    is_edu = np.fromiter(("edu" in e for e in emails), dtype=bool, count=n)
+    follower_count = np.fromiter((len(u.get('followers', [])) for u in users), dtype=np.int64, count=n)
+
+    score = np.full(n, 50, dtype=np.int64)
+    score += np.where(username_len > 8, 10, 0)
+    score += np.where(is_gmail, 5, np.where(is_edu, 20, 0))
+    score += follower_count * follower_points
+    return score
+
+def score_stream(infile, outfile, chunk_size=CHUNK_SIZE):
+    """
+    Scores users from infile chunk by chunk and writes NDJSON
+    {"id", "ai_score"} records to outfile. Returns the number of users.
+    """
+    total = 0
+    chunk = []
+
+    def flush(chunk):
+        scores = score_chunk(chunk)
+        outfile.write("".join(
+            '{"id": %s, "ai_score": %d}\n' % (json.dumps(u.get('_id', u.get('id'))), s)
+            for u, s in zip(chunk, scores.tolist())
+        ))
+
+    for user in iter_users(infile):
+        chunk.append(user)
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            total += len(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+        total += len(chunk)
+    outfile.flush()
+    return total
+
+class FollowerGraph:
+    """
+    Follower graph as int32 edge arrays (follower -> followed), built
+    user by user. Ids seen only in someone's followers list still get a
+    node: they pass rank on but aren't scored.
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.ids = []
+        self.src = array('i')
+        self.dst = array('i')
+        self.follower_counts = array('i')  # per scored user, raw len(followers)
+
+    def node(self, user_id):
+        i = self.index.get(user_id)
+        if i is None:
+            i = self.index[user_id] = len(self.ids)
+            self.ids.append(user_id)
+        return i
+
+    def add_user(self, user_id, followers):
+        i = self.node(user_id)
+        self.follower_counts.append(len(followers))
+        for follower in set(map(str, followers)):
+            j = self.node(follower)
+            if j != i:
+                self.src.append(j)
+                self.dst.append(i)
+        return i
+
+def pagerank(src, dst, n, x0=None, damping=DAMPING, tol=RANK_TOLERANCE, max_iter=MAX_ITERATIONS):
+    """
+    PageRank by power iteration over the edge arrays; rank flows from src to
+    dst, and users who follow nobody spread theirs evenly. `x0` (e.g. the
+    last run's ranks) is the starting vector; after a few edge changes it is
+    already close, so far fewer iterations are needed. Returns (ranks that
+    sum to 1, iterations used).
+    """
+    import numpy as np
+
+    src = np.frombuffer(src, dtype=np.int32) if not isinstance(src, np.ndarray) else src
+    dst = np.frombuffer(dst, dtype=np.int32) if not isinstance(dst, np.ndarray) else dst
+    if n == 0:
+        return np.zeros(0), 0
+    out_degree = np.bincount(src, minlength=n).astype(np.float64)
+    dangling = out_degree == 0
+    inv_degree = np.divide(1.0, out_degree, out=np.zeros(n), where=~dangling)
+
+    rank = np.full(n, 1.0 / n) if x0 is None else np.asarray(x0, dtype=np.float64) / x0.sum()
+    for iteration in range(1, max_iter + 1):
+        share = rank * inv_degree
+        incoming = np.zeros(n)
+        for start in range(0, len(src), EDGE_CHUNK):
+            end = start + EDGE_CHUNK
+            incoming += np.bincount(dst[start:end], weights=share[src[start:end]], minlength=n)
+        base = (1 - damping + damping * rank[dangling].sum()) / n
+        new_rank = base + damping * incoming
+        delta = np.abs(new_rank - rank).sum()
+        rank = new_rank
+        if delta < tol:
+            break
+    return rank, iteration
+
+def load_ranks(ids, index, path=RANK_PATH):
+    """
+    The saved ranks mapped onto this graph's nodes (new users start at the
+    average), or None if there is nothing saved.
+    """
+    import numpy as np
+
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as saved:
+            saved_ids = saved["ids"].tobytes().decode("utf-8").split("\n")
+            saved_rank = saved["rank"]
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ Ignoring saved ranks ({str(e)})", file=sys.stderr)
+        return None
+    x0 = np.full(len(ids), 1.0 / max(len(ids), 1))
+    for pid, value in zip(saved_ids, saved_rank.tolist()):
+        i = index.get(pid)
+        if i is not None:
+            x0[i] = value
+    return x0
+
+def save_ranks(ids, rank, path=RANK_PATH):
+    import numpy as np
+    # Ids as one newline-joined byte string: far smaller than a unicode array
+    packed = np.frombuffer("\n".join(ids).encode("utf-8"), dtype=np.uint8)
+    tmp_path = path + ".tmp.npz"
+    np.savez(tmp_path, ids=packed, rank=rank)
+    os.replace(tmp_path, path)
+
+def influence_points(rank, n):
+    """
+    INFLUENCE_POINTS per doubling of rank over the average user (1/n).
+    """
+    import numpy as np
+    return INFLUENCE_POINTS * np.log2(1 + rank * n)
+
+def score_graph_stream(infile, outfile, warm_start=True, rank_path=RANK_PATH, chunk_size=CHUNK_SIZE):
+    """
+    Graph mode: builds the follower graph while streaming users in, ranks it
+    with PageRank (warm-started from the last run's ranks) and writes NDJSON
+    {"id", "ai_score", "influence"} records in input order. The follower-count
+    feature is blended GRAPH_BLEND of the way towards influence points, so
+    followers count for what they're worth rather than how many there are.
+    Returns (users scored, PageRank iterations).
+    """
+    import numpy as np
+
+    graph = FollowerGraph()
+    scored = array('i')
+    base_scores = array('q')
+    chunk = []
+
+    def flush(chunk):
+        base_scores.extend(score_chunk(chunk, follower_points=0).tolist())
+
+    for user in iter_users(infile):
+        user_id = user.get('_id', user.get('id'))
+        # Users without an id still get a node of their own
+        user_id = str(user_id) if user_id is not None else f"#{len(scored)}"
+        scored.append(graph.add_user(user_id, user.get('followers') or []))
+        # Only the heuristic fields are kept per chunk, never the full user list
+        chunk.append({"username": user.get('username', ''), "email": user.get('email', '')})
+        if len(chunk) >= chunk_size:
+            flush(chunk)
+            chunk = []
+    if chunk:
+        flush(chunk)
+
+    n = len(graph.ids)
+    x0 = load_ranks(graph.ids, graph.index, rank_path) if warm_start and rank_path else None
+    rank, iterations = pagerank(graph.src, graph.dst, n, x0)
+    print(f"🕸️ Ranked {n} users over {len(graph.src)} follow edges in {iterations} iterations", file=sys.stderr)
+    if rank_path:
+        save_ranks(graph.ids, rank, rank_path)
+
+    scored = np.frombuffer(scored, dtype=np.int32)
+    influence = influence_points(rank[scored], n)
+    follower_counts = np.frombuffer(graph.follower_counts, dtype=np.int32)
+    follower_feature = (1 - GRAPH_BLEND) * 2 * follower_counts + GRAPH_BLEND * influence
+    scores = np.frombuffer(base_scores, dtype=np.int64) + np.rint(follower_feature).astype(np.int64)
+
+    for start in range(0, len(scored), chunk_size):
+        end = start + chunk_size
+        outfile.write("".join(
+            '{"id": %s, "ai_score": %d, "influence": %.3f}\n' % (json.dumps(graph.ids[i]), s, inf)
+            for i, s, inf in zip(scored[start:end].tolist(), scores[start:end].tolist(),
+                                 influence[start:end].tolist())
+        ))
+    outfile.flush()
+    return len(scored), iterations
+
 def main():
+    parser = argparse.ArgumentParser(description="User AI scoring (JSON on stdin)")
+    parser.add_argument('--ndjson', action='store_true',
+                        help="Stream NDJSON {id, ai_score} records instead of the full user list")
+    parser.add_argument('--graph', action='store_true',
+                        help="Blend follower-graph PageRank into the score (NDJSON {id, ai_score, influence} out)")
+    parser.add_argument('--cold', action='store_true', help="Graph mode: ignore the saved ranks")
+    args = parser.parse_args()
+
+    if args.graph:
+        try:
+            score_graph_stream(sys.stdin, sys.stdout, warm_start=not args.cold)
+        except Exception as e:
+            print(json.dumps({"error": str(e)}), file=sys.stderr)
+        return
+
+    if args.ndjson:
+        try:
+            score_stream(sys.stdin, sys.stdout)
+        except Exception as e:
+            print(json.dumps({"error": str(e)}), file=sys.stderr)
+        return
+
     try:
         # 1. Read input from Node.js (stdin)
         input_data = sys.stdin.read()
@@ -46,11 +352,7 @@ def main():
         users = json.loads(input_data)
         
         # 2. Process data
-        results = []
-        for user in users:
-            # Calculate the "AI Score"
-            user['ai_score'] = calculate_score(user)
-            results.append(user)
+        results = score_users(users)
 
         # 3. Print result to stdout (Node reads this)
         print(json.dumps(results))
@@ -60,4 +362,4 @@ def main():
         print(json.dumps({"error": str(e)}), file=sys.stderr)
 
 if __name__ == "__main__":
-    main()
+    metrics.run_main("scoring", main)
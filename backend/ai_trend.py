@@ -1,20 +1,79 @@
 import sys
 import json
 import os
-import google.generativeai as genai
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
-# 1. Setup the AI with the Environment Variable
-api_key = os.getenv("GEMINI_API_KEY")
+# Share the agents' response cache (agents use flat imports)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'agents'))
+import llm_cache
+import metrics
+import trend_state
+from structured_output import extract_json, parse_structured, validate
 
-if not api_key:
-    # Fallback if key is missing (prevents crash)
-    print(json.dumps([{"error": "Missing API Key"}])) 
-    sys.exit()
+MODEL_NAME = 'gemini-2.5-flash'
 
-genai.configure(api_key=api_key)
-model = genai.GenerativeModel('gemini-2.5-flash')
+# GEMINI_API_ENDPOINT points at another Gemini-compatible server (e.g. benchmarks/fake_llm.py)
+GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")
 
-def analyze_trend(product):
+# google.generativeai takes about a second to import, so the SDK is only
+# configured once a prompt actually has to be sent (cache hits never pay)
+_model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                import google.generativeai as genai
+                api_key = os.getenv("GEMINI_API_KEY")
+                if GEMINI_API_ENDPOINT:
+                    genai.configure(api_key=api_key, transport="rest",
+                                    client_options={"api_endpoint": GEMINI_API_ENDPOINT})
+                else:
+                    genai.configure(api_key=api_key)
+                _model = genai.GenerativeModel(MODEL_NAME)
+    return _model
+
+# Trend scores are re-used for a week unless the product changes
+CACHE_TTL = float(os.getenv("TREND_CACHE_TTL", str(7 * 86400)))
+
+# Batched scoring: products per prompt, prompts in flight, retry rounds
+BATCH_SIZE = int(os.getenv("TREND_BATCH_SIZE", "20"))
+CONCURRENCY = int(os.getenv("TREND_CONCURRENCY", "4"))
+MAX_ROUNDS = int(os.getenv("TREND_MAX_ROUNDS", "3"))
+
+DEFAULT_ANALYSIS = {"trendScore": 50, "marketingBlurb": "AI Analysis Unavailable"}
+
+SCHEMA = {
+    "trendScore": {"type": int, "required": True, "min": 0, "max": 100},
+    "marketingBlurb": {"type": str, "required": True},
+}
+
+# Gemini's JSON mode: the reply is always raw JSON, no fences or prose
+JSON_CONFIG = {"response_mime_type": "application/json"}
+
+def _generate(prompt):
+    started = time.perf_counter()
+    try:
+        response = get_model().generate_content(prompt, generation_config=JSON_CONFIG)
+        text = response.text
+    except Exception as e:
+        metrics.record("trend", MODEL_NAME, 0, time.perf_counter() - started, metrics.outcome_of(e), provider="gemini")
+        raise
+    prompt_tokens, completion_tokens = metrics.usage_tokens(getattr(response, "usage_metadata", None))
+    metrics.record("trend", MODEL_NAME, 0, time.perf_counter() - started, "ok",
+                   prompt_tokens, completion_tokens, provider="gemini")
+    return text
+
+def analyze_trend(product, use_cache=True):
+    """
+    Scores one product with its own prompt (the last resort for products
+    batches keep getting wrong). Returns the analysis, or None on failure.
+    """
     try:
         # 2. Construct the Prompt
         prompt = f"""
@@ -31,28 +90,349 @@ def analyze_trend(product):
         Return ONLY valid JSON like this: {{"trendScore": 85, "marketingBlurb": "The must-have look for summer."}}
         """
 
-        # 3. Call the AI
-        response = model.generate_content(prompt)
+        # 3. Call the AI (or reuse an earlier answer for the same prompt)
+        cache_key = llm_cache.make_key(MODEL_NAME, "", prompt) if use_cache else None
+        cached = llm_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            return json.loads(cached)
+        raw_text = _generate(prompt)
         
-        # 4. Clean up result (AI sometimes adds ```json markers)
-        text_response = response.text.replace('```json', '').replace('```', '').strip()
-        ai_data = json.loads(text_response)
+        # 4. Extract + validate (repairing, or asking Gemini to fix it, if needed)
+        ai_data = parse_structured(raw_text, SCHEMA, repair=_generate)
+
+        # Only cache answers that parsed
+        if cache_key:
+            llm_cache.put(cache_key, json.dumps(ai_data), CACHE_TTL)
         
         return ai_data
     except Exception as e:
-        return {"trendScore": 50, "marketingBlurb": "AI Analysis Unavailable"}
+        print(f"⚠️ Trend analysis failed for {product.get('title')}: {str(e)}", file=sys.stderr)
+        return None
+
+def product_id(product, index):
+    return str(product.get('_id') or product.get('id') or index)
+
+def _item_cache_key(product):
+    # Per-product key, so batched answers are reusable whatever batch they came from
+    fields = [product.get('title'), product.get('designer'), product.get('category'), product.get('price')]
+    return llm_cache.make_key(MODEL_NAME, "trend-item", json.dumps(fields, default=str))
+
+def analyze_trend_batch(items):
+    """
+    Scores several (id, product) pairs with one prompt. Returns {id: analysis}
+    for the items that came back well-formed; anything missing is left out so
+    the caller can re-queue it.
+    """
+    lines = "\n".join(
+        f"- id: {pid} | Item: {p.get('title')} | Designer: {p.get('designer')} | "
+        f"Category: {p.get('category')} | Price: ${p.get('price')}"
+        for pid, p in items
+    )
+    prompt = f"""
+        Analyze these fashion items:
+{lines}
+
+        Task, for EVERY item:
+        1. Give a 'trendScore' from 0 to 100 based on current fashion trends.
+        2. Write a short, catchy 1-sentence 'marketingBlurb' for social media.
+
+        Return ONLY a valid JSON array with one object per item, using the given id:
+        [{{"id": "abc", "trendScore": 85, "marketingBlurb": "The must-have look for summer."}}]
+        """
+    try:
+        data = extract_json(_generate(prompt), expect=list)
+    except Exception as e:
+        print(f"⚠️ Trend batch of {len(items)} failed: {str(e)}", file=sys.stderr)
+        return {}
+
+    wanted = {pid for pid, _ in items}
+    results = {}
+    for entry in data:
+        if not isinstance(entry, dict) or str(entry.get('id')) not in wanted:
+            continue
+        analysis, errors = validate(entry, SCHEMA)
+        if not errors:
+            results[str(entry.get('id'))] = analysis
+    return results
+
+def analyze_trend_singles(items, use_cache=True):
+    """
+    analyze_trend for each (id, product), with analyze_trend_batch's
+    contract: {id: analysis} for the ones that worked.
+    """
+    results = {}
+    for pid, p in items:
+        analysis = analyze_trend(p, use_cache)
+        if analysis is not None:
+            results[pid] = analysis
+    return results
+
+def analyze_trends(items, batch_size=BATCH_SIZE, concurrency=CONCURRENCY, use_cache=True, on_results=None):
+    """
+    Scores many (id, product) pairs, `batch_size` per prompt with `concurrency`
+    prompts in flight. Items missing or malformed in a batch's answer are
+    re-queued (in smaller batches) for up to MAX_ROUNDS, then get one prompt
+    each; whatever is still missing after that gets DEFAULT_ANALYSIS.
+    Returns {id: analysis}.
+    `on_results({id: analysis})` is called as real answers come in (cache
+    hits first, then once per batch); defaults are never passed to it.
+    """
+    results = {}
+    queue = []
+    for pid, p in items:
+        cached = llm_cache.get(_item_cache_key(p)) if use_cache else None
+        if cached is not None:
+            results[pid] = json.loads(cached)
+        else:
+            queue.append((pid, p))
+    if results and on_results:
+        on_results(dict(results))
+
+    products_by_id = dict(queue)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(MAX_ROUNDS):
+            if not queue:
+                break
+            batches = [queue[i:i + batch_size] for i in range(0, len(queue), batch_size)]
+            for answers in executor.map(analyze_trend_batch, batches):
+                for pid, analysis in answers.items():
+                    results[pid] = analysis
+                    if use_cache:
+                        llm_cache.put(_item_cache_key(products_by_id[pid]), json.dumps(analysis), CACHE_TTL)
+                if answers and on_results:
+                    on_results(answers)
+            queue = [(pid, p) for pid, p in queue if pid not in results]
+            batch_size = max(1, batch_size // 2)
+
+        # Last resort: one prompt per product, with the JSON repair pass
+        singles = [queue[i:i + batch_size] for i in range(0, len(queue), batch_size)]
+        for answers in executor.map(lambda chunk: analyze_trend_singles(chunk, use_cache), singles):
+            for pid, analysis in answers.items():
+                results[pid] = analysis
+                if use_cache:
+                    llm_cache.put(_item_cache_key(products_by_id[pid]), json.dumps(analysis), CACHE_TTL)
+            if answers and on_results:
+                on_results(answers)
+        queue = [(pid, p) for pid, p in queue if pid not in results]
+
+    for pid, _ in queue:
+        results[pid] = dict(DEFAULT_ANALYSIS)
+    return results
+
+def stream_trends(items, emit, batch_size=BATCH_SIZE, concurrency=CONCURRENCY, use_cache=True):
+    """
+    Streaming counterpart of analyze_trends: `items` is any iterable of
+    (id, product) and is read lazily; `emit(id, analysis)` is called (on this
+    thread) as soon as each product is scored, in completion order. Only
+    `concurrency` batches are in flight at a time, so memory doesn't grow
+    with the catalog. Products a batch's answer missed are re-queued in
+    smaller batches for up to MAX_ROUNDS attempts, then get one prompt each,
+    then DEFAULT_ANALYSIS.
+    """
+    items = iter(items)
+    retries = {}  # round -> [(id, product)]
+    in_flight = {}
+    exhausted = False
+
+    def next_batch():
+        nonlocal exhausted
+        # Re-queued products first (they're already in memory), then new input
+        for round_number in sorted(retries):
+            size = max(1, batch_size >> round_number)
+            queue = retries[round_number]
+            if len(queue) >= size or exhausted:
+                batch, retries[round_number] = queue[:size], queue[size:]
+                if not retries[round_number]:
+                    del retries[round_number]
+                return batch, round_number
+        batch = []
+        for pid, p in items:
+            cached = llm_cache.get(_item_cache_key(p)) if use_cache else None
+            if cached is not None:
+                emit(pid, json.loads(cached))
+                continue
+            batch.append((pid, p))
+            if len(batch) == batch_size:
+                return batch, 0
+        exhausted = True
+        if batch:
+            return batch, 0
+        # Input ran out: flush the partial retry queues as well
+        return next_batch() if retries else None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        while True:
+            while len(in_flight) < concurrency:
+                batch = next_batch()
+                if batch is None:
+                    break
+                if batch[1] < MAX_ROUNDS:
+                    future = executor.submit(analyze_trend_batch, batch[0])
+                else:
+                    future = executor.submit(analyze_trend_singles, batch[0], use_cache)
+                in_flight[future] = batch
+            if not in_flight:
+                return
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch, round_number = in_flight.pop(future)
+                answers = future.result()
+                for pid, p in batch:
+                    if pid in answers:
+                        if use_cache:
+                            llm_cache.put(_item_cache_key(p), json.dumps(answers[pid]), CACHE_TTL)
+                        emit(pid, answers[pid])
+                    elif round_number < MAX_ROUNDS:
+                        retries.setdefault(round_number + 1, []).append((pid, p))
+                    else:
+                        emit(pid, dict(DEFAULT_ANALYSIS))
+
+def run_ndjson(lines, out, batch_size=BATCH_SIZE, concurrency=CONCURRENCY):
+    """
+    NDJSON mode: one product per input line, one (updated) product per output
+    line, flushed as soon as it is ready so the caller can apply updates
+    progressively. Products that already have a trendScore are echoed
+    unchanged straight away; the rest follow in completion order, not input
+    order. Returns summary counts.
+    """
+    summary = {"products": 0, "analyzed": 0, "skipped": 0, "invalid": 0}
+    products = {}
+
+    def write(record):
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+
+    def pending():
+        for index, line in enumerate(lines):
+            if not line.strip():
+                continue
+            try:
+                p = json.loads(line)
+            except ValueError:
+                summary["invalid"] += 1
+                write({"error": "Invalid JSON line", "line": index + 1})
+                continue
+            if not isinstance(p, dict):
+                summary["invalid"] += 1
+                write({"error": "Line must be a JSON object", "line": index + 1})
+                continue
+            summary["products"] += 1
+            if p.get('trendScore', 0) != 0:
+                summary["skipped"] += 1
+                write(p)
+                continue
+            pid = product_id(p, index)
+            if pid in products:
+                # Same id still in flight: keep both rows
+                pid = f"{pid}#{index}"
+            products[pid] = p
+            yield pid, p
+
+    def emit(pid, analysis):
+        p = products.pop(pid)
+        p['trendScore'] = analysis.get('trendScore', 0)
+        p['marketingBlurb'] = analysis.get('marketingBlurb', "")
+        summary["analyzed"] += 1
+        write(p)
+
+    stream_trends(pending(), emit, batch_size, concurrency)
+    return summary
+
+def run_job(products, state, batch_size=BATCH_SIZE, concurrency=CONCURRENCY, full=False):
+    """
+    Incremental catalog refresh. Only products that are new, changed
+    (title/designer/category/price) or expired go to Gemini; every batch's
+    answers are checkpointed in `state` (a trend_state.TrendState) as they
+    arrive, so rerunning after a crash only redoes the unfinished part.
+    Selected products bypass the LLM cache, which would otherwise answer them
+    with a score of up to a week old.
+    Products scored before the job existed are adopted as-is on first sight.
+    Returns ({id: analysis} for every product, summary counts).
+    """
+    products_by_id = {product_id(p, i): p for i, p in enumerate(products)}
+    known = state.lookup(products_by_id)
+    now = time.time()
+
+    summary = {trend_state.NEW: 0, trend_state.CHANGED: 0, trend_state.EXPIRED: 0, trend_state.FRESH: 0,
+               "adopted": 0, "analyzed": 0, "failed": 0}
+    analyses, adopted, pending = {}, {}, []
+    for pid, p in products_by_id.items():
+        status = state.classify(p, known.get(pid), now)
+        summary[status] += 1
+        if status == trend_state.FRESH and not full:
+            analyses[pid] = known[pid][2]
+        elif status == trend_state.NEW and not full and p.get('trendScore') and p.get('marketingBlurb'):
+            adopted[pid] = {"trendScore": p['trendScore'], "marketingBlurb": p['marketingBlurb']}
+        else:
+            pending.append((pid, p))
+
+    if adopted:
+        state.save(adopted, products_by_id, now)
+        analyses.update(adopted)
+        summary["adopted"] = len(adopted)
+
+    print(f"📋 Trend job: {len(pending)} of {len(products_by_id)} products need analysis", file=sys.stderr)
+
+    def checkpoint(answers):
+        state.save(answers, products_by_id)
+        summary["analyzed"] += len(answers)
+        print(f"💾 Checkpointed {summary['analyzed']}/{len(pending)}", file=sys.stderr)
+
+    analyses.update(analyze_trends(pending, batch_size, concurrency, use_cache=False, on_results=checkpoint))
+    summary["failed"] = len(pending) - summary["analyzed"]
+    return analyses, summary
 
 def main():
+    parser = argparse.ArgumentParser(description="Gemini trend scoring for products (JSON on stdin)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help="Products per Gemini prompt")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help="Prompts in flight")
+    parser.add_argument('--ndjson', action='store_true',
+                        help="One product per line in, one result per line out as soon as it is ready")
+    parser.add_argument('--job', action='store_true',
+                        help="Incremental refresh: re-analyze only new/changed/expired products, with checkpoints")
+    parser.add_argument('--state', default=trend_state.STATE_PATH, help="Job state file")
+    parser.add_argument('--max-age-days', type=float, default=trend_state.MAX_AGE_DAYS,
+                        help="Job mode: re-analyze unchanged products older than this")
+    parser.add_argument('--full', action='store_true', help="Job mode: re-analyze every product")
+    parser.add_argument('--prune', action='store_true', help="Job mode: forget products missing from the input")
+    args = parser.parse_args()
+    if args.ndjson and args.job:
+        parser.error("--ndjson is not supported in --job mode")
+
+    if not os.getenv("GEMINI_API_KEY"):
+        # Fallback if key is missing (prevents crash)
+        error = {"error": "Missing API Key"}
+        print(json.dumps(error if args.ndjson else [error]))
+        return
+
+    if args.ndjson:
+        summary = run_ndjson(sys.stdin, sys.stdout, args.batch_size, args.concurrency)
+        print(json.dumps({"trend_ndjson": summary}), file=sys.stderr)
+        return
+
     try:
         # Read input from Node.js
         input_data = sys.stdin.read()
         products = json.loads(input_data)
-        
-        results = []
-        for p in products:
+
+        if args.job:
+            state = trend_state.TrendState(args.state, args.max_age_days)
+            try:
+                analyses, summary = run_job(products, state, args.batch_size, args.concurrency, args.full)
+                if args.prune:
+                    summary["pruned"] = state.prune(analyses)
+            finally:
+                state.close()
+            print(json.dumps({"trend_job": summary}), file=sys.stderr)
+        else:
             # Only analyze if it doesn't have a score yet (to save API credits)
-            if p.get('trendScore', 0) == 0:
-                analysis = analyze_trend(p)
+            pending = [(product_id(p, i), p) for i, p in enumerate(products) if p.get('trendScore', 0) == 0]
+            analyses = analyze_trends(pending, args.batch_size, args.concurrency)
+
+        results = []
+        for i, p in enumerate(products):
+            analysis = analyses.get(product_id(p, i))
+            if analysis is not None:
                 p['trendScore'] = analysis.get('trendScore', 0)
                 p['marketingBlurb'] = analysis.get('marketingBlurb', "")
             results.append(p)
@@ -64,4 +444,4 @@ def main():
         print(json.dumps({"error": str(e)}), file=sys.stderr)
 
 if __name__ == "__main__":
-    main()
+    metrics.run_main("trend", main)
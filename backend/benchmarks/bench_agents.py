@@ -0,0 +1,319 @@
+"""
+End-to-end latency/throughput benchmark for the agent layer.
+
+Runs against the local fake LLM server (benchmarks/fake_llm.py), so it needs
+no API keys or network. Every scenario runs in its own Python process (so
+peak RSS is its own) and prints one JSON object per line: calls, errors,
+p50/p95/p99 latency in ms, calls per second, peak RSS and the fake server's
+request counts.
+
+Scenarios (one "call" in brackets):
+    query    utils_openrouter.query_openrouter from many threads   [one query]
+    stream   utils_openrouter.stream_openrouter, adds TTFT         [one stream]
+    seyna    seyna.main                                            [one meeting]
+    trend    ai_trend.main over a product catalog                  [one Gemini prompt]
+    pixel    pixel.analyze_image on generated images               [one image]
+    scoring  ai_scoring.main on synthetic users                    [one run]
+
+Usage (from backend/):
+    python benchmarks/bench_agents.py
+    python benchmarks/bench_agents.py --scenarios query trend --scale 5 --output bench.json
+    python benchmarks/bench_agents.py --profile slow_profile.json --keep-rate-limits
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+AGENTS_DIR = os.path.join(BACKEND_DIR, "agents")
+
+# Calls per scenario at --scale 1
+BASE_COUNTS = {"query": 500, "stream": 100, "seyna": 40, "trend": 2000, "pixel": 200, "scoring": 5}
+THREADS = {"query": 16, "stream": 8, "pixel": 8}
+SCORING_USERS = 50_000
+
+
+def percentile(values, q):
+    # Nearest-rank percentile of an unsorted list
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def summarize(name, latencies, errors, elapsed, **extra):
+    from bench_scoring import peak_rss_mb
+    calls = len(latencies)
+    ms = lambda q: round(percentile(latencies, q) * 1000, 1) if latencies else None
+    return {
+        "scenario": name, "calls": calls, "errors": errors,
+        "p50_ms": ms(50), "p95_ms": ms(95), "p99_ms": ms(99),
+        "calls_per_sec": round(calls / elapsed, 1) if elapsed else None,
+        "seconds": round(elapsed, 3), "peak_rss_mb": peak_rss_mb(), **extra,
+    }
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - started, result
+
+
+def run_threads(fn, items, threads):
+    """
+    Calls fn(item) for every item on `threads` threads; returns
+    ([(latency, result)], wall seconds).
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda item: timed(fn, item), items))
+    return results, time.perf_counter() - started
+
+
+@contextlib.contextmanager
+def script_io(stdin_text, argv):
+    """
+    Runs a script's main() with the given stdin/argv; yields its stdout buffer.
+    """
+    saved = sys.stdin, sys.argv
+    sys.stdin, sys.argv = io.StringIO(stdin_text), argv
+    out = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(out):
+            yield out
+    finally:
+        sys.stdin, sys.argv = saved
+
+
+def warm_up():
+    # SDKs load lazily on the first request; cold start is check_import_time.py's
+    # job, so keep it out of per-call latency here
+    import utils_openrouter
+    utils_openrouter.get_client()
+
+
+# --- Scenarios (run inside the child process) ---
+
+def bench_query(count):
+    warm_up()
+    from utils_openrouter import query_openrouter
+    prompts = [f"Suggest an outfit for occasion #{i}" for i in range(count)]
+    model = "meta-llama/llama-3.2-3b-instruct:free"
+    results, elapsed = run_threads(lambda p: query_openrouter(model, "You are a stylist.", p),
+                                   prompts, THREADS["query"])
+    errors = sum(1 for _, r in results if r.startswith("All models failed"))
+    return summarize("query", [t for t, _ in results], errors, elapsed)
+
+
+def bench_stream(count):
+    warm_up()
+    from utils_openrouter import stream_openrouter
+    model = "meta-llama/llama-3.2-3b-instruct:free"
+
+    def one(prompt):
+        return list(stream_openrouter(model, "You are Pixie.", prompt))[-1]
+
+    results, elapsed = run_threads(one, [f"What goes with look #{i}?" for i in range(count)], THREADS["stream"])
+    ttfts = [r["ttft_ms"] / 1000 for _, r in results if r.get("type") == "done" and r.get("ttft_ms") is not None]
+    errors = sum(1 for _, r in results if r.get("type") != "done")
+    return summarize("stream", [t for t, _ in results], errors, elapsed,
+                     ttft_p50_ms=round(percentile(ttfts, 50) * 1000, 1) if ttfts else None,
+                     ttft_p95_ms=round(percentile(ttfts, 95) * 1000, 1) if ttfts else None)
+
+
+def bench_seyna(count):
+    warm_up()
+    import seyna
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for i in range(count):
+        with script_io(json.dumps({"goal": f"Launch capsule collection #{i}"}), ["seyna.py"]) as out:
+            latency, _ = timed(seyna.main)
+        latencies.append(latency)
+        report = json.loads(out.getvalue())
+        if "error" in report or any(r.get("status") != "ok" for r in report["team_reports"]):
+            errors += 1
+    return summarize("seyna", latencies, errors, time.perf_counter() - started)
+
+
+def bench_trend(count):
+    import ai_trend
+    ai_trend.get_model()
+    rng = random.Random(3)
+    products = [
+        {"_id": f"p{i}", "title": f"{rng.choice(['Oversized', 'Cropped', 'Pleated'])} "
+                                  f"{rng.choice(['Blazer', 'Trench', 'Skirt', 'Jeans'])} {i}",
+         "designer": rng.choice(["Atelier Nova", "Maison Gris", "Kuro"]),
+         "category": rng.choice(["Outerwear", "Bottoms", "Tops"]),
+         "price": rng.randint(40, 900), "trendScore": 0}
+        for i in range(count)
+    ]
+
+    # One call = one Gemini prompt (a batch); time each one
+    latencies, failures = [], []
+    generate = ai_trend._generate
+
+    def timed_generate(prompt):
+        started = time.perf_counter()
+        try:
+            return generate(prompt)
+        except Exception:
+            failures.append(1)
+            raise
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    ai_trend._generate = timed_generate
+    with script_io(json.dumps(products), ["ai_trend.py"]) as out:
+        elapsed, _ = timed(ai_trend.main)
+    scored = json.loads(out.getvalue() or "[]")
+    unscored = sum(1 for p in scored if p.get("marketingBlurb") in (None, "", ai_trend.DEFAULT_ANALYSIS["marketingBlurb"]))
+    return summarize("trend", latencies, len(failures), elapsed, products=count,
+                     products_per_sec=round(count / elapsed, 1), unscored_products=unscored)
+
+
+def make_image_url(rng, size=96):
+    from PIL import Image
+    # Noise images, so none of them count as near-duplicates of another
+    image = Image.frombytes("RGB", (size, size), bytes(rng.getrandbits(8) for _ in range(size * size * 3)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def bench_pixel(count):
+    warm_up()
+    from pixel import analyze_image
+    rng = random.Random(5)
+    urls = [make_image_url(rng) for _ in range(count)]
+    results, elapsed = run_threads(analyze_image, urls, THREADS["pixel"])
+    errors = sum(1 for _, r in results if "error" in r)
+    return summarize("pixel", [t for t, _ in results], errors, elapsed)
+
+
+def bench_scoring(count):
+    import ai_scoring
+    from bench_scoring import SyntheticUsers
+    payload = SyntheticUsers(SCORING_USERS).read(1 << 62)
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    for _ in range(count):
+        with script_io(payload, ["ai_scoring.py"]) as out:
+            latency, _ = timed(ai_scoring.main)
+        latencies.append(latency)
+        errors += not out.getvalue().startswith("[")
+    elapsed = time.perf_counter() - started
+    return summarize("scoring", latencies, errors, elapsed, users_per_run=SCORING_USERS,
+                     users_per_sec=round(SCORING_USERS * count / elapsed))
+
+
+SCENARIOS = {
+    "query": bench_query,
+    "stream": bench_stream,
+    "seyna": bench_seyna,
+    "trend": bench_trend,
+    "pixel": bench_pixel,
+    "scoring": bench_scoring,
+}
+
+
+# --- Orchestration (parent process) ---
+
+def server_counts(base_url):
+    with urllib.request.urlopen(base_url + "/stats", timeout=5) as response:
+        counts = json.load(response)
+    totals = {}
+    for per_model in counts.values():
+        for outcome, n in per_model.items():
+            totals[outcome] = totals.get(outcome, 0) + n
+    return totals
+
+
+def child_env(base_url, cache_dir, keep_rate_limits):
+    env = dict(os.environ)
+    env.update({
+        "OPENROUTER_BASE_URL": base_url + "/v1",
+        "OPENROUTER_API_KEY": "bench-key",
+        "GEMINI_API_ENDPOINT": base_url,
+        "GEMINI_API_KEY": "bench-key",
+        "AGENT_CACHE_DIR": cache_dir,
+        # Every call should reach the server
+        "LLM_CACHE_DISABLED": "1",
+        "PYTHONPATH": os.pathsep.join(filter(None, [AGENTS_DIR, BACKEND_DIR, env.get("PYTHONPATH")])),
+    })
+    if not keep_rate_limits:
+        # Measure the agents, not our own politeness towards OpenRouter
+        env.update({"OPENROUTER_MODEL_RPM": "1000000", "OPENROUTER_KEY_RPM": "1000000",
+                    "OPENROUTER_BURST": "10000"})
+    return env
+
+
+def run_scenario(name, count, base_url, keep_rate_limits):
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as cache_dir:
+        before = server_counts(base_url)
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run", name, "--count", str(count)],
+            env=child_env(base_url, cache_dir, keep_rate_limits),
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+        )
+        after = server_counts(base_url)
+    lines = proc.stdout.strip().splitlines()
+    if proc.returncode != 0 or not lines:
+        return {"scenario": name, "error": f"benchmark process exited with {proc.returncode}"}
+    result = json.loads(lines[-1])
+    result["server"] = {k: after.get(k, 0) - before.get(k, 0) for k in after}
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies every scenario's call count")
+    parser.add_argument("--profile", help="Latency/error profile for the fake server (see fake_llm.py)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="Keep the real OPENROUTER_*_RPM limits instead of lifting them")
+    parser.add_argument("--output", help="Also write all results to this JSON file")
+    parser.add_argument("--run", choices=sorted(SCENARIOS), help=argparse.SUPPRESS)
+    parser.add_argument("--count", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Child process: run one scenario and print its result
+    if args.run:
+        for path in (BENCH_DIR, BACKEND_DIR, AGENTS_DIR):
+            if path not in sys.path:
+                sys.path.insert(0, path)
+        print(json.dumps(SCENARIOS[args.run](args.count)), flush=True)
+        return
+
+    sys.path.insert(0, BENCH_DIR)
+    import fake_llm
+    server, base_url = fake_llm.start_server(fake_llm.load_profile(args.profile), seed=args.seed)
+    results = []
+    try:
+        for name in args.scenarios:
+            count = max(1, int(BASE_COUNTS[name] * args.scale))
+            result = run_scenario(name, count, base_url, args.keep_rate_limits)
+            results.append(result)
+            print(json.dumps(result), flush=True)
+    finally:
+        server.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"scale": args.scale, "profile": args.profile or "default", "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
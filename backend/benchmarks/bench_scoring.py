@@ -0,0 +1,203 @@
+"""
+Throughput benchmark for ai_scoring.
+
+Feeds synthetic users (generated on the fly, so the input never has to fit in
+memory) through the streaming NDJSON scorer and, for smaller sizes, through
+the original per-user score_users path. Prints one JSON object per run.
+
+--graph benchmarks graph mode instead: PageRank on synthetic follower graphs
+(cold, then warm-started after 0.1% of the edges change), and the whole
+--graph pipeline (parse, build, rank, write) end to end.
+
+Usage (from backend/):
+    python benchmarks/bench_scoring.py                      # 10k, 1M, 10M
+    python benchmarks/bench_scoring.py --sizes 10000 100000
+    python benchmarks/bench_scoring.py --graph              # 100k, 1M, 3M users x 10 edges
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import resource
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ai_scoring
+
+DOMAINS = ["gmail.com", "stanford.edu", "fashfolio.io", "yahoo.com"]
+
+
+def make_user(i, rng):
+    return {
+        "_id": f"user_{i}",
+        "username": "designer" + "x" * rng.randint(0, 6),
+        "email": f"u{i}@{rng.choice(DOMAINS)}",
+        "followers": [f"user_{rng.randrange(i + 1)}" for _ in range(rng.randint(0, 8))],
+        "bio": "Streetwear, vintage and everything in between.",
+    }
+
+
+def user_templates(size=4096, seed=7):
+    """
+    Pre-rendered user JSON minus the leading _id, so generating millions of
+    users costs a string concat rather than a json.dumps each.
+    """
+    rng = random.Random(seed)
+    templates = []
+    for i in range(size):
+        user = make_user(i, rng)
+        del user["_id"]
+        templates.append(json.dumps(user)[1:])
+    return templates
+
+
+class SyntheticUsers(io.TextIOBase):
+    """
+    Read-only text stream that renders `count` users as a JSON array on demand.
+    """
+
+    def __init__(self, count):
+        self.count = count
+        self.templates = user_templates()
+        self.next_index = 0
+        self.finished = False
+        self.pending = "["
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        size = size if size and size > 0 else 1 << 20
+        parts = [self.pending]
+        length = len(self.pending)
+        while length < size and not self.finished:
+            if self.next_index < self.count:
+                prefix = "," if self.next_index else ""
+                template = self.templates[self.next_index % len(self.templates)]
+                text = '%s{"_id": "user_%d", %s' % (prefix, self.next_index, template)
+                self.next_index += 1
+            else:
+                text = "]"
+                self.finished = True
+            parts.append(text)
+            length += len(text)
+        data = "".join(parts)
+        self.pending = data[size:]
+        return data[:size]
+
+
+class NullSink(io.TextIOBase):
+    def __init__(self):
+        self.chars = 0
+
+    def write(self, text):
+        self.chars += len(text)
+        return len(text)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def bench_stream(count):
+    users = SyntheticUsers(count)
+    started = time.perf_counter()
+    scored = ai_scoring.score_stream(users, NullSink())
+    elapsed = time.perf_counter() - started
+    return {"mode": "ndjson_stream", "users": scored, "seconds": round(elapsed, 3),
+            "users_per_sec": round(scored / elapsed), "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_baseline(count):
+    # Same input as the streaming run, parsed and scored the way main() does it
+    payload = SyntheticUsers(count).read(1 << 62)
+    started = time.perf_counter()
+    json.dumps(ai_scoring.score_users(json.loads(payload)))
+    elapsed = time.perf_counter() - started
+    return {"mode": "baseline", "users": count, "seconds": round(elapsed, 3),
+            "users_per_sec": round(count / elapsed), "peak_rss_mb": peak_rss_mb()}
+
+
+def synthetic_graph(users, edges_per_user, seed=11):
+    """
+    int32 (src, dst) follow edges with a heavy-tailed in-degree: a few users
+    are followed by a large share of everyone, most by almost nobody.
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    count = users * edges_per_user
+    src = rng.integers(0, users, count, dtype=np.int32)
+    dst = (users * rng.random(count) ** 3).astype(np.int32)
+    return src, dst
+
+
+def bench_pagerank(users, edges_per_user):
+    import numpy as np
+    src, dst = synthetic_graph(users, edges_per_user)
+    started = time.perf_counter()
+    rank, cold_iterations = ai_scoring.pagerank(src, dst, users)
+    cold = time.perf_counter() - started
+
+    # A day's worth of follows / unfollows: rewire 0.1% of the edges
+    rng = np.random.default_rng(3)
+    changed = rng.choice(len(src), max(1, len(src) // 1000), replace=False)
+    src[changed] = rng.integers(0, users, len(changed), dtype=np.int32)
+    dst[changed] = rng.integers(0, users, len(changed), dtype=np.int32)
+    started = time.perf_counter()
+    _, warm_iterations = ai_scoring.pagerank(src, dst, users, x0=rank)
+    warm = time.perf_counter() - started
+    return {"mode": "pagerank", "users": users, "edges": len(src),
+            "cold_seconds": round(cold, 3), "cold_iterations": cold_iterations,
+            "warm_seconds": round(warm, 3), "warm_iterations": warm_iterations,
+            "edges_per_sec": round(len(src) * cold_iterations / cold), "peak_rss_mb": peak_rss_mb()}
+
+
+def bench_graph_stream(count):
+    users = SyntheticUsers(count)
+    started = time.perf_counter()
+    scored, iterations = ai_scoring.score_graph_stream(users, NullSink(), warm_start=False, rank_path=None)
+    elapsed = time.perf_counter() - started
+    return {"mode": "graph_stream", "users": scored, "iterations": iterations, "seconds": round(elapsed, 3),
+            "users_per_sec": round(scored / elapsed), "peak_rss_mb": peak_rss_mb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=None,
+                        help="User counts (default: 10k 1M 10M, or 100k 1M 3M with --graph)")
+    parser.add_argument("--baseline-max", type=int, default=1_000_000,
+                        help="Largest size to also run through the in-memory baseline")
+    parser.add_argument("--graph", action="store_true", help="Benchmark graph (PageRank) mode instead")
+    parser.add_argument("--edges-per-user", type=int, default=10, help="Graph mode: average follows per user")
+    parser.add_argument("--stream-max", type=int, default=1_000_000,
+                        help="Graph mode: largest size to also run through the full --graph pipeline")
+    args = parser.parse_args()
+
+    if args.graph:
+        sizes = args.sizes or [100_000, 1_000_000, 3_000_000]
+        for size in sizes:
+            print(json.dumps(bench_pagerank(size, args.edges_per_user)), flush=True)
+        for size in sizes:
+            if size <= args.stream_max:
+                print(json.dumps(bench_graph_stream(size)), flush=True)
+        return
+    args.sizes = args.sizes or [10_000, 1_000_000, 10_000_000]
+
+    # Keep NumPy's import time out of the first measurement
+    ai_scoring.score_chunk([{}])
+
+    # Streaming runs first so their peak RSS isn't inflated by the baseline's lists
+    for size in args.sizes:
+        print(json.dumps(bench_stream(size)), flush=True)
+    for size in args.sizes:
+        if size <= args.baseline_max:
+            print(json.dumps(bench_baseline(size)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Cold-start budget check for the Python entry points.
+
+server.js spawns these scripts per request, so their import time is request
+latency. For each entry point this runs `python -X importtime -c "import X"`
+in a fresh interpreter (best of --runs) and fails if:
+  - its cumulative import time exceeds the budget, or
+  - it imports a heavy SDK at module level that should only load on first use.
+
+Prints one JSON object per entry point; exits 1 on any violation.
+
+Usage (from backend/):
+    python benchmarks/check_import_time.py
+    python benchmarks/check_import_time.py --budget-scale 2     # slow CI machine
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AGENTS_DIR = os.path.join(BACKEND_DIR, "agents")
+
+# Cumulative import time budgets in milliseconds (a few times today's numbers,
+# well under the ~1s the openai / google.generativeai SDKs cost on their own)
+BUDGETS_MS = {
+    "ai_agent": 150,
+    "ai_trend": 150,
+    "ai_scoring": 80,
+    "seyna": 150,
+    "pixel": 150,
+}
+
+# Only imported once a request actually needs them
+LAZY_MODULES = ("openai", "httpx", "google.generativeai", "requests", "PIL", "numpy", "asyncio", "dotenv")
+
+
+def import_profile(module):
+    """
+    Returns ({module name: cumulative µs}, wall ms) for one cold import.
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([BACKEND_DIR, AGENTS_DIR]))
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env, cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        cumulative[name.strip()] = int(cumulative_us)
+    return cumulative, wall_ms
+
+
+def check(module, budget_ms, runs):
+    best_ms, best_wall = None, None
+    imported = set()
+    for _ in range(runs):
+        cumulative, wall_ms = import_profile(module)
+        import_ms = cumulative.get(module, 0) / 1000
+        best_ms = import_ms if best_ms is None else min(best_ms, import_ms)
+        best_wall = wall_ms if best_wall is None else min(best_wall, wall_ms)
+        imported.update(cumulative)
+
+    eager = sorted(m for m in LAZY_MODULES if m in imported)
+    return {
+        "entry": module,
+        "import_ms": round(best_ms, 1),
+        "budget_ms": budget_ms,
+        "process_ms": round(best_wall, 1),
+        "eager_heavy_imports": eager,
+        "ok": best_ms <= budget_ms and not eager,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="Cold imports per entry point (best is kept)")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Multiplies every budget")
+    parser.add_argument("--entries", nargs="+", choices=sorted(BUDGETS_MS), default=list(BUDGETS_MS))
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.entries:
+        result = check(module, round(BUDGETS_MS[module] * args.budget_scale), args.runs)
+        print(json.dumps(result), flush=True)
+        failed = failed or not result["ok"]
+
+    if failed:
+        print("❌ Cold-start import budget exceeded", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Timing check for 429 handling in the request scheduler and model health.
+
+Runs against the real RequestScheduler / model_health code (no network) and
+fails if:
+  - a Retry-After block delays the next request by more than the block
+    itself, or lets a burst through once it ends
+  - repeated 429s with a short Retry-After close the circuit before the
+    repeated-failure cooldown (MODEL_COOLDOWN_SECONDS)
+
+Prints one JSON object per check; exits 1 on any violation.
+
+Usage (from backend/):
+    python benchmarks/check_rate_limits.py
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BACKEND_DIR, "agents"))
+
+# Keep the health file away from the real cache
+os.environ["MODEL_HEALTH_PATH"] = os.path.join(tempfile.mkdtemp(prefix="rate_limits_"), "model_health.json")
+
+import model_health
+from utils_openrouter import RequestScheduler
+
+# Scheduling slack allowed on top of the expected wait
+TOLERANCE = 0.1
+
+
+def timed_acquire(scheduler, model):
+    started = time.monotonic()
+    scheduler.acquire(model)
+    return time.monotonic() - started
+
+
+def check_block_release(block=0.3):
+    """
+    A `block`-second penalty delays the next grant by about `block` (not by
+    a whole token interval), and the one after that by one token interval.
+    """
+    # 20 RPM: a token every 3s, far longer than the block
+    slow = RequestScheduler(model_rpm=20, key_rpm=6000, burst=5)
+    slow.acquire("m")
+    slow.penalize("m", block)
+    next_grant = timed_acquire(slow, "m")
+
+    # 600 RPM: a token every 0.1s; a full bucket must not burst after the block
+    fast = RequestScheduler(model_rpm=600, key_rpm=6000, burst=5)
+    fast.penalize("m", block)
+    timed_acquire(fast, "m")
+    following = timed_acquire(fast, "m")
+
+    ok = (block - 0.01 <= next_grant <= block + TOLERANCE
+          and 0.1 - 0.01 <= following <= 0.1 + TOLERANCE)
+    return {"check": "block_release", "block_s": block, "next_grant_s": round(next_grant, 3),
+            "following_grant_s": round(following, 3), "ok": ok}
+
+
+def check_circuit_cooldown(retry_after=0.3):
+    """
+    FAILURE_THRESHOLD 429s in a row keep the circuit open for at least
+    COOLDOWN_SECONDS even when each carried a short Retry-After.
+    """
+    model = "check/model"
+    for _ in range(model_health.FAILURE_THRESHOLD):
+        model_health.record_failure(model, rate_limited=True, retry_after=retry_after)
+    open_for = model_health.load_state()[model]["open_until"] - time.time()
+    single = "check/single"
+    model_health.record_failure(single, rate_limited=True, retry_after=retry_after)
+    single_open_for = model_health.load_state()[single]["open_until"] - time.time()
+    ok = (open_for >= model_health.COOLDOWN_SECONDS - 1
+          and retry_after - 0.1 <= single_open_for <= retry_after)
+    return {"check": "circuit_cooldown", "retry_after_s": retry_after,
+            "open_after_threshold_s": round(open_for, 1), "open_after_one_s": round(single_open_for, 2),
+            "ok": ok}
+
+
+def main():
+    failed = False
+    for check in (check_block_release, check_circuit_cooldown):
+        result = check()
+        print(json.dumps(result))
+        failed = failed or not result["ok"]
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
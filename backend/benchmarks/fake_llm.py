@@ -0,0 +1,267 @@
+"""
+Local stand-in for OpenRouter (OpenAI-compatible) and Gemini, for offline
+benchmarks.
+
+Each model gets a latency distribution, an error rate, a 429 rate (with a
+Retry-After) and a streaming speed. Replies are shaped like what the agents
+ask for: trend JSON (single or batched), Pixel's vision JSON, or plain prose.
+
+Endpoints:
+    POST /v1/chat/completions                      OpenAI-compatible (+ stream)
+    POST /v1beta/models/{model}:generateContent    Gemini REST
+    GET  /stats                                    request counts per model/status
+
+Usage (from backend/):
+    python benchmarks/fake_llm.py --port 8790
+    python benchmarks/fake_llm.py --port 0 --profile my_profile.json
+
+A profile is JSON: {"default": {...}, "models": {"name": {...}}} where each
+entry may set latency_ms {"p50", "p95"}, error_rate, rate_limit_rate,
+retry_after and tokens_per_sec. Point the agents at it with
+OPENROUTER_BASE_URL=http://127.0.0.1:PORT/v1 and GEMINI_API_ENDPOINT=http://127.0.0.1:PORT.
+"""
+import re
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_PROFILE = {
+    "default": {
+        "latency_ms": {"p50": 40, "p95": 150},
+        "error_rate": 0.01,
+        "rate_limit_rate": 0.02,
+        "retry_after": 0.2,
+        "tokens_per_sec": 400,
+    },
+    "models": {},
+}
+
+WORDS = ("bold tailored silhouettes meet soft sustainable fabrics for a confident "
+         "everyday look that sells itself on social").split()
+
+BATCH_ID = re.compile(r"- id: (\S+)")
+
+
+def model_settings(profile, model):
+    settings = dict(profile.get("default", {}))
+    settings.update(profile.get("models", {}).get(model, {}))
+    return settings
+
+
+def sample_latency(settings, rng):
+    """
+    Lognormal latency in seconds matching the profile's p50/p95.
+    """
+    latency = settings.get("latency_ms", {})
+    p50 = max(latency.get("p50", 0), 0.001)
+    p95 = max(latency.get("p95", p50), p50)
+    sigma = (math.log(p95) - math.log(p50)) / 1.645
+    return rng.lognormvariate(math.log(p50), sigma) / 1000
+
+
+def reply_for(prompt, rng):
+    """
+    A plausible answer for whichever agent sent `prompt`.
+    """
+    if "trendScore" in prompt:
+        ids = BATCH_ID.findall(prompt)
+        entry = lambda: {"trendScore": rng.randint(20, 95), "marketingBlurb": " ".join(rng.sample(WORDS, 8))}
+        if ids:
+            return json.dumps([{"id": pid, **entry()} for pid in ids])
+        return json.dumps(entry())
+    if "visual_rating" in prompt:
+        return json.dumps({
+            "color_hex": "#%06X" % rng.randrange(1 << 24),
+            "fabric": rng.choice(["Denim", "Silk", "Wool", "Linen"]),
+            "style_tags": rng.sample(["Minimalist", "Streetwear", "Vintage", "Avant-garde", "Casual"], 2),
+            "visual_rating": round(rng.uniform(5, 9.5), 1),
+        })
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 80)))
+
+
+def estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+class FakeLLM(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, profile, seed=None):
+        super().__init__(address, Handler)
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, model, outcome):
+        with self.lock:
+            per_model = self.counts.setdefault(model, {})
+            per_model[outcome] = per_model.get(outcome, 0) + 1
+
+    def roll(self, model):
+        """
+        Decides one request's fate: (outcome, latency seconds, settings).
+        """
+        settings = model_settings(self.profile, model)
+        with self.lock:
+            latency = sample_latency(settings, self.rng)
+            draw = self.rng.random()
+        if draw < settings.get("rate_limit_rate", 0):
+            return "rate_limited", latency / 4, settings
+        if draw < settings.get("rate_limit_rate", 0) + settings.get("error_rate", 0):
+            return "error", latency, settings
+        return "ok", latency, settings
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        return json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+
+    def do_GET(self):
+        if self.path.startswith("/stats"):
+            with self.server.lock:
+                self._send_json(200, self.server.counts)
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if self.path.startswith("/v1/chat/completions"):
+            self._chat()
+        elif ":generateContent" in self.path:
+            self._gemini()
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def _fail(self, outcome, settings, latency):
+        time.sleep(latency)
+        if outcome == "rate_limited":
+            self._send_json(429, {"error": {"message": "Rate limit exceeded", "code": 429}},
+                            {"Retry-After": str(settings.get("retry_after", 1))})
+        else:
+            self._send_json(500, {"error": {"message": "Upstream provider error", "code": 500}})
+
+    def _chat(self):
+        body = self._read_body()
+        model = body.get("model", "unknown")
+        outcome, latency, settings = self.server.roll(model)
+        self.server.count(model, outcome)
+        if outcome != "ok":
+            return self._fail(outcome, settings, latency)
+
+        prompt = " ".join(
+            part.get("text", "") if isinstance(part, dict) else str(part)
+            for message in body.get("messages", [])
+            for part in (message.get("content") if isinstance(message.get("content"), list)
+                         else [message.get("content") or ""])
+        )
+        with self.server.lock:
+            text = reply_for(prompt, self.server.rng)
+        usage = {"prompt_tokens": estimate_tokens(prompt), "completion_tokens": estimate_tokens(text)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        # Latency is the time to first token; streaming then paces the rest
+        time.sleep(latency)
+        if body.get("stream"):
+            return self._stream(model, text, usage, settings)
+        self._send_json(200, {
+            "id": "fake-" + str(time.time_ns()), "object": "chat.completion", "created": int(time.time()),
+            "model": model, "usage": usage,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        })
+
+    def _stream(self, model, text, usage, settings):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        delay = 1.0 / max(settings.get("tokens_per_sec", 400), 1)
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            chunk = {"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {"content": word + (" " if i < len(words) - 1 else "")},
+                                  "finish_reason": None}]}
+            self.wfile.write(b"data: " + json.dumps(chunk).encode() + b"\n\n")
+            self.wfile.flush()
+            time.sleep(delay)
+        final = {"id": "fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                 "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+        self.wfile.write(b"data: " + json.dumps(final).encode() + b"\n\ndata: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _gemini(self):
+        model = self.path.split("/models/", 1)[-1].split(":", 1)[0]
+        body = self._read_body()
+        outcome, latency, settings = self.server.roll(model)
+        self.server.count(model, outcome)
+        if outcome != "ok":
+            return self._fail(outcome, settings, latency)
+
+        prompt = " ".join(part.get("text", "") for content in body.get("contents", [])
+                          for part in content.get("parts", []))
+        with self.server.lock:
+            text = reply_for(prompt, self.server.rng)
+        time.sleep(latency)
+        prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+        self._send_json(200, {
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"},
+                            "finishReason": "STOP", "index": 0}],
+            "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens,
+                              "totalTokenCount": prompt_tokens + completion_tokens},
+        })
+
+
+def load_profile(path=None):
+    if not path:
+        return DEFAULT_PROFILE
+    with open(path) as f:
+        return json.load(f)
+
+
+def start_server(profile=None, host="127.0.0.1", port=0, seed=None):
+    """
+    Starts the fake server on a background thread; returns (server, base_url).
+    """
+    server = FakeLLM((host, port), profile or DEFAULT_PROFILE, seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790, help="0 picks a free port")
+    parser.add_argument("--profile", help="JSON latency/error profile (see module docstring)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    server = FakeLLM((args.host, args.port), load_profile(args.profile), args.seed)
+    # First stdout line tells a parent process where we listen
+    print(f"http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
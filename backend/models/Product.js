@@ -18,6 +18,11 @@ const ProductSchema = new mongoose.Schema({
     fabricType: { type: String },    // e.g. "Denim"
 
     createdAt: { type: Date, default: Date.now }
+}, {
+    // updatedAt lets resident agent workers fetch only the products that changed
+    timestamps: { createdAt: false, updatedAt: true }
 });
 
+ProductSchema.index({ updatedAt: 1 });
+
 module.exports = mongoose.model('Product', ProductSchema);
@@ -6,11 +6,46 @@ const { spawn } = require('child_process');
 const { OpenRouter } = require("@openrouter/sdk"); // Add OpenRouter SDK
 const Product = require('./models/Product');
 const path = require('path');
+const fs = require('fs');
+const { AgentWorkerPool } = require('./agentWorker');
 
 // Helper to get the correct Python path
 // Helper to get the correct Python path
 const pythonCommand = process.env.PYTHON_COMMAND || 'python';
 
+// Optional resident Python workers (AGENT_WORKERS=N) instead of one process per request
+const agentPool = parseInt(process.env.AGENT_WORKERS || '0', 10) > 0
+    ? new AgentWorkerPool({ size: parseInt(process.env.AGENT_WORKERS, 10), pythonCommand })
+    : null;
+
+// How much of the catalog Pixie gets to search per chat (ranked in ai_agent.py)
+// when each chat runs in a new process; resident workers keep the whole catalog
+const pixieInventoryLimit = parseInt(process.env.PIXIE_INVENTORY_LIMIT || '2000', 10);
+const pixieCatalogResyncMs = parseInt(process.env.PIXIE_CATALOG_RESYNC_MS || '600000', 10);
+const pixieFields = 'title designer price category trendScore aiTags';
+
+// Brings a resident worker's copy of the catalog up to date (see AgentWorkerPool.call):
+// the whole catalog the first time and every PIXIE_CATALOG_RESYNC_MS (which also
+// drops deleted products), otherwise only the products updated since the last sync.
+async function syncPixieCatalog(state) {
+    const now = Date.now();
+    const full = !state || now - state.loadedAt > pixieCatalogResyncMs;
+    const products = await Product.find(full ? {} : { updatedAt: { $gte: state.cursor } })
+        .select(`${pixieFields} updatedAt`)
+        .lean();
+    if (!full && products.length === 0) return null;
+
+    let cursor = full ? new Date(0) : state.cursor;
+    for (const product of products) {
+        if (product.updatedAt > cursor) cursor = product.updatedAt;
+    }
+    return {
+        state: { cursor, loadedAt: full ? now : state.loadedAt },
+        method: 'catalog',
+        params: { products, replace: full }
+    };
+}
+
 const app = express();
 app.use(express.json());
 app.use(cors()); // Allow Frontend access
@@ -52,36 +87,44 @@ app.post('/api/products', async (req, res) => {
         if (image) {
             console.log("👁️ Pixel Agent is analyzing visual data...");
 
-            // Wrap Python call in a Promise
-            const pixelResult = await new Promise((resolve) => {
-                const pythonProcess = spawn(pythonCommand, ['./agents/pixel.py'], {
-                    env: { ...process.env, PYTHONPATH: './agents' }
+            let pixelResult = {};
+            if (agentPool) {
+                pixelResult = await agentPool.call('pixel', { imageUrl: image }).catch((e) => {
+                    console.error("Pixel Worker Error:", e.message);
+                    return {};
                 });
+            } else {
+                // Wrap Python call in a Promise
+                pixelResult = await new Promise((resolve) => {
+                    const pythonProcess = spawn(pythonCommand, ['./agents/pixel.py'], {
+                        env: { ...process.env, PYTHONPATH: './agents' }
+                    });
 
-                let dataString = '';
+                    let dataString = '';
 
-                // Handle input errors gracefully
-                pythonProcess.stdin.on('error', (err) => {
-                    console.error("Stdin Error:", err);
-                    resolve({});
-                });
+                    // Handle input errors gracefully
+                    pythonProcess.stdin.on('error', (err) => {
+                        console.error("Stdin Error:", err);
+                        resolve({});
+                    });
 
-                pythonProcess.stdin.write(JSON.stringify({ imageUrl: image }));
-                pythonProcess.stdin.end();
+                    pythonProcess.stdin.write(JSON.stringify({ imageUrl: image }));
+                    pythonProcess.stdin.end();
 
-                pythonProcess.stdout.on('data', (data) => dataString += data.toString());
+                    pythonProcess.stdout.on('data', (data) => dataString += data.toString());
 
-                pythonProcess.on('close', (code) => {
-                    try {
-                        // Parse result (handle potential Python print warnings)
-                        const result = JSON.parse(dataString);
-                        resolve(result);
-                    } catch (e) {
-                        console.error("Pixel Parse Error. Raw output:", dataString);
-                        resolve({});
-                    }
+                    pythonProcess.on('close', (code) => {
+                        try {
+                            // Parse result (handle potential Python print warnings)
+                            const result = JSON.parse(dataString);
+                            resolve(result);
+                        } catch (e) {
+                            console.error("Pixel Parse Error. Raw output:", dataString);
+                            resolve({});
+                        }
+                    });
                 });
-            });
+            }
 
             // 3. Merge Pixel's Data
             if (pixelResult.style_tags) {
@@ -186,6 +229,15 @@ app.get('/api/analyze-trends', async (req, res) => {
 app.post('/api/score-users', async (req, res) => {
     try {
         const users = req.body;
+
+        if (agentPool) {
+            try {
+                return res.json(await agentPool.call('score', { users }));
+            } catch (e) {
+                return res.status(500).json({ error: "AI Scoring Failed", details: e.message });
+            }
+        }
+
         // Use consolidated pythonCommand
         const pythonProcess = spawn(pythonCommand, ['./ai_scoring.py']);
 
@@ -224,6 +276,14 @@ app.post('/api/score-users', async (req, res) => {
 app.post('/api/seyna/command', async (req, res) => {
     const { goal } = req.body;
 
+    if (agentPool) {
+        try {
+            return res.json(await agentPool.call('seyna', { goal }));
+        } catch (e) {
+            return res.status(500).json({ error: "Seyna Operation Failed", details: e.message });
+        }
+    }
+
     const pythonProcess = spawn(pythonCommand, ['./agents/seyna.py'], {
         env: { ...process.env, PYTHONPATH: './agents' }
     });
@@ -262,8 +322,21 @@ app.post('/api/agent/chat', async (req, res) => {
         // 1. Extract context (default to 'CREATIVE_MODE' if missing)
         const { message, context = "CREATIVE_MODE" } = req.body;
 
-        // Fetch a small subset of products for context
-        const inventory = await Product.find().limit(10).select('title price category trendScore');
+        if (agentPool) {
+            // The worker already holds the catalog; only what changed is sent along
+            try {
+                return res.json(await agentPool.call('chat', { query: message, context }, syncPixieCatalog));
+            } catch (e) {
+                return res.status(500).json({ error: "Agent Process Failed", details: e.message });
+            }
+        }
+
+        // Pixie ranks the catalog against the question and keeps only the top matches
+        const inventory = await Product.find()
+            .sort({ createdAt: -1 })
+            .limit(pixieInventoryLimit)
+            .select(pixieFields)
+            .lean();
 
         const inputPayload = {
             query: message,
@@ -308,5 +381,68 @@ app.post('/api/agent/chat', async (req, res) => {
     }
 });
 
+// 7. PIXIE AGENT CHAT (Streaming, Server-Sent Events)
+app.post('/api/agent/chat/stream', async (req, res) => {
+    try {
+        const { message, context = "CREATIVE_MODE" } = req.body;
+        const inventory = await Product.find()
+            .sort({ createdAt: -1 })
+            .limit(pixieInventoryLimit)
+            .select(pixieFields)
+            .lean();
+
+        res.writeHead(200, {
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'Connection': 'keep-alive'
+        });
+
+        const pythonProcess = spawn(pythonCommand, ['./ai_agent.py'], {
+            env: { ...process.env }
+        });
+
+        pythonProcess.stdin.write(JSON.stringify({ query: message, products: inventory, context, stream: true }));
+        pythonProcess.stdin.end();
+
+        // ai_agent.py prints one NDJSON event per line; forward each as an SSE message
+        let buffered = '';
+        pythonProcess.stdout.on('data', (data) => {
+            buffered += data.toString();
+            const lines = buffered.split('\n');
+            buffered = lines.pop();
+            for (const line of lines) {
+                if (line.trim()) res.write(`data: ${line}\n\n`);
+            }
+        });
+
+        pythonProcess.stderr.on('data', (data) => {
+            console.error("Pixie Agent Error:", data.toString());
+        });
+
+        pythonProcess.on('close', () => {
+            if (buffered.trim()) res.write(`data: ${buffered}\n\n`);
+            res.end();
+        });
+
+        // Stop generating if the browser goes away
+        res.on('close', () => pythonProcess.kill());
+
+    } catch (err) {
+        if (!res.headersSent) res.status(500).json({ error: err.message });
+        else res.end();
+    }
+});
+
+// Agent metrics (Prometheus text format), written by agents/metrics.py
+const agentMetricsPath = process.env.AGENT_METRICS_PROM
+    || path.join(process.env.AGENT_CACHE_DIR || path.join(__dirname, '.cache'), 'agent_metrics.prom');
+
+app.get('/metrics', (req, res) => {
+    fs.readFile(agentMetricsPath, 'utf8', (err, text) => {
+        // No agent has run yet: an empty exposition is still valid
+        res.type('text/plain; version=0.0.4').send(err ? '' : text);
+    });
+});
+
 const PORT = process.env.PORT || 5000;
 app.listen(PORT, () => console.log(`FashFolio Server running on port ${PORT}`));